@@ -7,37 +7,42 @@ using the amber10 collection of forcefield parameters.
 """
 
 #=============================================================================================
-# TURN DEBUG LOGGING ON
+# SET LOGGING LEVEL (set REPEX_DEBUG=1 in the environment for debug output)
 #=============================================================================================
 
+import os
 import logging
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=logging.DEBUG if os.environ.get("REPEX_DEBUG") else logging.INFO)
 
 #=============================================================================================
 # RUN PARALLEL TEMPERING SIMULATION
 #=============================================================================================
 
-import os
 import mpi4py
 mpi4py.rc.initialize = False
 from mpi4py import MPI  # noqa
 
 print("setup mpi")
-# init mpi4py:
-MPI.Init_thread()
-# get communicator: duplicate from comm world
-mpicomm = MPI.COMM_WORLD.Dup()
+# init mpi4py: only the main thread makes MPI calls
+MPI.Init_thread(required=MPI.THREAD_FUNNELED)
+# repex does not modify the communicator, so use comm world directly
+mpicomm = MPI.COMM_WORLD
 # now match ranks between the mpi comm and the nccl comm
 os.environ["WORLD_SIZE"] = str(mpicomm.Get_size())
 os.environ["RANK"] = str(mpicomm.Get_rank())
 print(os.environ["WORLD_SIZE"])
 print("rank",os.environ["RANK"])
 
+# Import repex and OpenMM once, after MPI is initialized (repex queries the MPI rank on import).
+from simtk import unit
+from simtk.openmm import app
+import repex
+from repex import ParallelTempering
+
 
 output_filename = "new_repex.nc" #"repex.nc" # name of NetCDF file to store simulation output
 
 # If simulation file already exists, try to resume.
-import os.path
 resume = False
 if os.path.exists(output_filename):
     resume = True
@@ -45,7 +50,6 @@ if os.path.exists(output_filename):
 if resume:
     try:
         print("Attempting to resume existing simulation...")
-        import repex
         simulation = repex.resume(output_filename)
         
         # Extend the simulation by a few iterations.
@@ -62,7 +66,6 @@ if not resume:
     print("Starting new simulation...")
 
     # Set parallel tempering parameters
-    from simtk import unit
     # Temperatures will be exponentially (geometrically) spaced by default
     T_min = 273.0 * unit.kelvin # minimum temperature for parallel tempering ladder
     T_max = 600.0 * unit.kelvin # maximum temperature for parallel tempering ladder
@@ -72,7 +75,6 @@ if not resume:
     timestep = 2.0 * unit.femtosecond # timestep for Langevin dynamics
     
     # Load forcefield.
-    from simtk.openmm import app
     forcefield = app.ForceField("amber10.xml", "amber10_obc.xml")
 
     # Load PDB file.
@@ -84,16 +86,13 @@ if not resume:
 
     # Create OpenMM system and retrieve atomic positions.
     system = forcefield.createSystem(model.topology, nonbondedMethod=app.NoCutoff, constraints=app.HBonds)
-    replica_positions = [model.positions for i in range(n_temps)] # number of replica positions as input must match number of replicas
+    replica_positions = model.positions # a single set of positions is shared by all replicas
 
     # Create parallel tempering simulation object.
-    import repex
-   
-
-    #mpicomm = repex.dummympi.DummyMPIComm()
-    parameters = {"number_of_iterations" : 10}
-    parameters = {"collision_rate" : collision_rate}
-    from repex import ParallelTempering
+    parameters = {"number_of_iterations" : 10, "collision_rate" : collision_rate, "timestep" : timestep}
+    parameters["write_buffer_size"] = 100 # write iterations to disk in batches of 100
+    parameters["sync_interval"] = 100 # a sync also writes out the buffer, so sync no more often than the buffer fills
+    parameters["netcdf_compression"] = 1 # zlib level for stored per-iteration data; set to 0 to disable when benchmarking
     simulation = ParallelTempering.create(system, replica_positions, output_filename, T_min=T_min, T_max=T_max, n_temps=n_temps, mpicomm=mpicomm, parameters=parameters)
 
     # Run the parallel tempering simulation.
@@ -46,7 +46,7 @@ def _set_logging():
     except:
         import dummympi as MPI # Fake MPI wrapper
     if MPI.COMM_WORLD.rank == 0:
-        logging.basicConfig(level=logging.DEBUG)  # Change this to INFO for public release!
+        logging.basicConfig(level=logging.INFO)
     else:  # By default, silence output from worker nodes
         logging.basicConfig(level=logging.ERROR)
 
@@ -0,0 +1,25 @@
+"""Ahead-of-time compile the replica mixing kernels with numba.
+
+Running
+
+    python -m repex._mix_aot
+
+builds the `repex_mix` extension module next to this file.  `repex.kernels`
+picks it up at import time, so end-user scripts don't pay numba's JIT
+compilation cost on their first iteration.  Without the extension,
+`repex.kernels` falls back to JIT compilation.
+"""
+
+import os
+
+from numba.pycc import CC
+
+from repex import kernels
+
+cc = CC("repex_mix")
+cc.output_dir = os.path.dirname(os.path.abspath(__file__))
+cc.export("mix_all_replicas", kernels.AOT_SIGNATURES["mix_all_replicas"])(kernels._mix_all_replicas)
+
+
+if __name__ == "__main__":
+    cc.compile()
@@ -74,9 +74,8 @@ class Analyzer(object):
 
         if state_index is not None:
             replica_indices = self.states[:].argsort()[:, state_index]
-            n = len(replica_indices)
-            xyz = np.array([self.positions[i, replica_indices[i]] for i in range(n)])  # Have to do this because netcdf4py breaks numpy fancy indexing and calls it a "feature" because it looks "more like fortran".
-            box_vectors = np.array([self.box_vectors[i, replica_indices[i]] for i in range(n)])
+            xyz = self._read_by_replica(self.positions, replica_indices)
+            box_vectors = self._read_by_replica(self.box_vectors, replica_indices)
 
         traj = md.Trajectory(xyz, self._traj.top)
         traj.unitcell_vectors = box_vectors
@@ -106,11 +105,50 @@ class Analyzer(object):
         be aware.
         """
         replica_indices = self.states[:].argsort()
-        n = len(replica_indices)
-        reordered = np.array([trace[i, replica_indices[i]] for i in range(n)])  # Have to do this because netcdf4py breaks numpy fancy indexing and calls it a "feature" because it looks "more like fortran".
+        reordered = self._read_by_replica(trace, replica_indices)
         
         return reordered
 
+    def _read_by_replica(self, trace, replica_indices, max_block_bytes=64 * 1024**2):
+        """Return trace[i, replica_indices[i]] for every iteration i.
+
+        Parameters
+        ----------
+        trace : database property or np.ndarray
+            The variable to read, with iterations along the first axis and
+            replicas along the second.
+        replica_indices : np.ndarray, shape=(n_iterations, ...)
+            Replica index (or indices) to take from each iteration.
+        max_block_bytes : int, default=64 MB
+            Approximate size of each slab read from `trace`.
+
+        Returns
+        -------
+        selected : np.ndarray
+            The selected data, in memory.
+
+        Notes
+        -----
+        netcdf4py does not support numpy fancy indexing across dimensions,
+        and one read per iteration pays the full HDF5 (and decompression)
+        overhead each time.  Instead we read contiguous slabs spanning many
+        iterations and do the fancy indexing in memory.
+        """
+        n = len(replica_indices)
+        if n == 0:
+            return np.empty(replica_indices.shape + tuple(trace.shape[2:]), trace.dtype)
+
+        frame_bytes = int(np.prod(trace.shape[1:])) * np.dtype(trace.dtype).itemsize
+        block_size = max(1, max_block_bytes // max(1, frame_bytes))
+
+        selected = []
+        for start in range(0, n, block_size):
+            block = np.asarray(trace[start:start + block_size])
+            rows = np.arange(len(block)).reshape((len(block),) + (1,) * (replica_indices.ndim - 1))
+            selected.append(block[rows, replica_indices[start:start + len(block)]])
+
+        return np.concatenate(selected)
+
 
     def check_energies(self):
         """Examine energy history for signs of instability (nans)."""
@@ -119,24 +157,23 @@ class Analyzer(object):
         n_iterations = self.energies.shape[0]
 
         logger.info("Reading energies...")
-        u_kln_replica = np.zeros([self.n_states, self.n_states, n_iterations], np.float64)
-        for n in range(n_iterations):
-            u_kln_replica[:, :, n] = self.energies[n]
+        energies = np.asarray(self.energies[:])
+        states = np.asarray(self.states[:])
+        u_kln_replica = np.transpose(energies, (1, 2, 0)).astype(np.float64)
         logger.info("Done.")
 
         logger.info("Deconvoluting replicas...")
         u_kln = np.zeros([self.n_states, self.n_states, n_iterations], np.float64)
         for iteration in range(n_iterations):
-            state_indices = self.states[iteration]
-            u_kln[state_indices, :, iteration] = self.energies[iteration]
+            u_kln[states[iteration], :, iteration] = energies[iteration]
         logger.info("Done.")
 
         # If no energies are 'nan', we're clean.
-        if not np.any(np.isnan(self.energies[:])):
+        if not np.any(np.isnan(energies)):
             return
 
         # There are some energies that are 'nan', so check if the first iteration has nans in their *own* energies:
-        u_k = np.diag(self.energies[0])
+        u_k = np.diag(energies[0])
         if np.any(np.isnan(u_k)):
             logger.info("First iteration has exploded replicas.  Check to make sure structures are minimized before dynamics")
             logger.info("Energies for all replicas after equilibration:")
@@ -147,7 +184,7 @@ class Analyzer(object):
         first_nan_k = np.zeros([self.n_states], np.int32)
         for iteration in range(n_iterations):
             for k in range(self.n_states):
-                if np.isnan(self.energies[iteration, k, k]) and first_nan_k[k] == 0:
+                if np.isnan(energies[iteration, k, k]) and first_nan_k[k] == 0:
                     first_nan_k[k] = iteration
         
         if not all(first_nan_k == 0):
@@ -157,7 +194,7 @@ class Analyzer(object):
             logger.info("Writing PDB files immediately before explosions were detected...")
             for replica in range(self.n_states):            
                 if (first_nan_k[replica] > 0):
-                    state = self.states[iteration,replica]
+                    state = states[iteration,replica]
                     iteration = first_nan_k[replica] - 1
                     filename = 'replica-%d-before-explosion.pdb' % replica
 
@@ -176,8 +213,9 @@ class Analyzer(object):
         n_iterations = self.positions.shape[0]
 
         for iteration in range(n_iterations):
+            positions_iteration = np.asarray(self.positions[iteration])  # One read per iteration, rather than per replica
             for replica in range(self.n_states):
-                positions = self.positions[iteration, replica]
+                positions = positions_iteration[replica]
                 # Check for nan
                 if np.any(np.isnan(positions)):
                     # Nan found -- raise error
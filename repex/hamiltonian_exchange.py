@@ -1,5 +1,15 @@
+import copy
+import time
+
+import numpy as np
+
+import simtk.openmm as mm
+import simtk.unit as units
+
+from repex import thermodynamics
 from repex.thermodynamics import ThermodynamicState
 from repex.replica_exchange import ReplicaExchange
+from repex.constants import kB
 
 import logging
 logger = logging.getLogger(__name__)
@@ -26,16 +36,53 @@ class HamiltonianExchange(ReplicaExchange):
 
     def _check_self_consistency(self, thermodynamic_states):
         """Checks that each state has the same temperature and pressure, as required for HamiltonianExchange."""
-        
-        for s0 in thermodynamic_states:
-            for s1 in thermodynamic_states:
-                if s0.pressure != s1.pressure:
-                    raise(ValueError("For HamiltonianExchange, ThermodynamicState objects cannot have different pressures!"))
 
-        for s0 in thermodynamic_states:
-            for s1 in thermodynamic_states:
-                if s0.temperature != s1.temperature:
-                    raise(ValueError("For HamiltonianExchange, ThermodynamicState objects cannot have different temperatures!"))
+        signatures = frozenset((state.temperature.value_in_unit(units.kelvin), None if state.pressure is None else state.pressure.value_in_unit(units.bar)) for state in thermodynamic_states)
+        if len(signatures) > 1:
+            raise ValueError("For HamiltonianExchange, ThermodynamicState objects must have the same temperature and pressure; found (temperature in K, pressure in bar): %s" % ", ".join(str(signature) for signature in sorted(signatures, key=str)))
+
+
+    def _compute_energies(self):
+        """Compute reduced potentials of all replicas at all states.
+
+        Notes
+        -----
+
+        All states share the same temperature and pressure (enforced by
+        `_check_self_consistency`), so beta is a scalar and the pV term
+        depends only on each replica's box.  We therefore collect the
+        potential energies U_kl in kJ/mol and form u_kl = beta * (U_kl + pV_k)
+        with a single array operation.
+        """
+
+        start_time = time.time()
+        logger.debug("Computing energies...")
+
+        reference_state = self.thermodynamic_states[0]
+        beta = 1.0 / (kB * reference_state.temperature).value_in_unit(units.kilojoules_per_mole)
+
+        # Compute potential energies for this node's share of states.
+        U_kl = np.zeros([self.n_states, self.n_states], np.float64)
+        for state_index in range(self.mpicomm.rank, self.n_states, self.mpicomm.size):
+            state = self.thermodynamic_states[state_index]
+            for replica_index in range(self.n_states):
+                sampler_state = self.sampler_states[replica_index]
+                U_kl[replica_index, state_index] = state._potential_energy(sampler_state.positions, box_vectors=sampler_state.box_vectors, platform=self.platform).value_in_unit(units.kilojoules_per_mole)
+
+        # Add the pressure-volume work of each replica, which is the same at every state.
+        if reference_state.pressure is not None:
+            pV_k = np.array([(reference_state.pressure * thermodynamics.volume(sampler_state.box_vectors) * units.AVOGADRO_CONSTANT_NA).value_in_unit(units.kilojoules_per_mole) for sampler_state in self.sampler_states])
+            U_kl += pV_k[:, np.newaxis]
+
+        self.u_kl[:, :] = beta * U_kl
+
+        # Send final energies to all nodes.
+        self._gather_energies()
+
+        end_time = time.time()
+        elapsed_time = end_time - start_time
+        time_per_energy = elapsed_time / float(self.n_states)**2
+        logger.debug("Time to compute all energies %.3f s (%.3f per energy calculation).", elapsed_time, time_per_energy)
 
 
     @classmethod
@@ -70,5 +117,70 @@ class HamiltonianExchange(ReplicaExchange):
 
         """
       
-        thermodynamic_states = [ ThermodynamicState(system=system, temperature=reference_state.temperature, pressure=reference_state.pressure) for system in systems ]
+        temperature = reference_state.temperature
+        pressure = reference_state.pressure
+        thermodynamic_states = [ ThermodynamicState._fast_clone_with_system(copy.deepcopy(system), temperature, pressure) for system in systems ]  # The systems belong to the caller
         return super(cls, HamiltonianExchange).create(thermodynamic_states, coordinates, filename, mpicomm=mpicomm, platform=platform, parameters=parameters)
+
+    @classmethod
+    def create_from_lambda(cls, reference_state, lambda_values, coordinates, filename, parameter_name='lambda', mpicomm=None, platform=None, parameters={}):
+        """Create a new Hamiltonian exchange simulation from a single system and a set of global parameter values.
+
+        Parameters
+        ----------
+
+        reference_state : ThermodynamicState
+            reference state containing all thermodynamic parameters and the
+            system, whose global parameter `parameter_name` will be varied
+        lambda_values : list(float)
+            value of the global parameter for each replica
+        coordinates : simtk.unit.Quantity, shape=(n_atoms, 3), unit=Length
+            coordinates (or a list of coordinates objects) for initial 
+            assignment of replicas (will be used in round-robin assignment)
+        filename : string 
+            name of NetCDF file to bind to for simulation output and checkpointing
+        parameter_name : string, default='lambda'
+            name of the global parameter (e.g. of a CustomNonbondedForce) to set
+        mpicomm : mpi4py communicator, default=None
+            MPI communicator, if parallel execution is desired.      
+        parameters (dict) - Optional parameters to use for specifying simulation
+            Provided keywords will be matched to object variables to replace defaults.
+
+        Notes
+        -----
+
+        The reference system is serialized once and each replica's system is
+        deserialized from that XML, which avoids building the system from the
+        forcefield once per replica.  The states take ownership of these new
+        systems, so they are not copied again.
+
+        """
+
+        serialized_system = mm.XmlSerializer.serialize(reference_state.system)
+
+        # Each deserialized system is new, so the states can own them without another copy.
+        temperature = reference_state.temperature
+        pressure = reference_state.pressure
+        thermodynamic_states = []
+        for lambda_value in lambda_values:
+            system = mm.XmlSerializer.deserialize(serialized_system)
+            _set_global_parameter_default(system, parameter_name, lambda_value)
+            thermodynamic_states.append(ThermodynamicState._fast_clone_with_system(system, temperature, pressure))
+
+        return super(cls, HamiltonianExchange).create(thermodynamic_states, coordinates, filename, mpicomm=mpicomm, platform=platform, parameters=parameters)
+
+
+def _set_global_parameter_default(system, parameter_name, value):
+    """Set the default value of a global parameter in every force of `system` that defines it."""
+
+    found = False
+    for force in system.getForces():
+        if not hasattr(force, "getNumGlobalParameters"):
+            continue
+        for parameter_index in range(force.getNumGlobalParameters()):
+            if force.getGlobalParameterName(parameter_index) == parameter_name:
+                force.setGlobalParameterDefaultValue(parameter_index, value)
+                found = True
+
+    if not found:
+        raise ValueError("Global parameter '%s' not found in any force of the system!" % parameter_name)
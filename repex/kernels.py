@@ -0,0 +1,110 @@
+"""Compiled kernels for the inner loops of replica exchange.
+
+The kernels are compiled with numba when it is available.  If numba cannot
+be imported, `HAVE_NUMBA` is False and callers should use their pure-Python
+implementations instead.
+
+The kernels can also be compiled ahead of time into the `repex.repex_mix`
+extension module by running `python -m repex._mix_aot`.  When that module
+is present (`HAVE_AOT`), it is used for arrays of the exported dtypes, so
+short runs do not pay the JIT compilation cost.
+"""
+
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        """Stand-in for numba.njit that leaves the function uncompiled."""
+        def decorator(function):
+            return function
+        return decorator
+
+try:
+    from repex import repex_mix
+    HAVE_AOT = True
+except ImportError:
+    HAVE_AOT = False
+
+# Numba type signatures of the ahead-of-time compiled kernels.
+AOT_SIGNATURES = {
+    "mix_all_replicas": "void(f8[:,:], i8[:], i8[:,:], i8[:,:], i8)",
+}
+
+
+def mix_all_replicas(u_kl, replica_states, Nij_proposed, Nij_accepted, nswap_attempts):
+    """Attempt swaps between randomly chosen pairs of replicas.
+
+    Dispatches to the ahead-of-time compiled kernel if it is available and
+    the arrays have the dtypes it was compiled for, and to the JIT-compiled
+    kernel otherwise.  See `_mix_all_replicas` for the parameters.
+    """
+    if HAVE_AOT and u_kl.dtype == np.float64 and replica_states.dtype == np.int64 and Nij_proposed.dtype == np.int64 and Nij_accepted.dtype == np.int64:
+        repex_mix.mix_all_replicas(u_kl, replica_states, Nij_proposed, Nij_accepted, nswap_attempts)
+    else:
+        _mix_all_replicas_jit(u_kl, replica_states, Nij_proposed, Nij_accepted, nswap_attempts)
+
+
+def _mix_all_replicas(u_kl, replica_states, Nij_proposed, Nij_accepted, nswap_attempts):
+    """Attempt swaps between randomly chosen pairs of replicas.
+
+    Parameters
+    ----------
+    u_kl : np.ndarray, shape=(n_states, n_states)
+        u_kl[k, l] is the reduced potential of replica k in state l.
+        Usually float64; float32 energies are promoted for the acceptance test.
+    replica_states : np.ndarray, shape=(n_states,), dtype=int
+        replica_states[k] is the state of replica k; updated in place.
+    Nij_proposed : np.ndarray, shape=(n_states, n_states), dtype=int
+        Number of swaps proposed between states i and j; updated in place.
+    Nij_accepted : np.ndarray, shape=(n_states, n_states), dtype=int
+        Number of swaps accepted between states i and j; updated in place.
+    nswap_attempts : int
+        Number of swaps to attempt.
+
+    Notes
+    -----
+    This is the same Metropolis scheme as ReplicaExchange._mix_all_replicas().
+    Random numbers are drawn from numba's own generator, which is seeded
+    independently of numpy's.
+    """
+    n_states = replica_states.shape[0]
+
+    for swap_attempt in range(nswap_attempts):
+        # Choose replicas to attempt to swap.
+        i = np.random.randint(0, n_states)
+        j = np.random.randint(0, n_states)
+
+        # Determine which states these replicas correspond to.
+        istate = replica_states[i]
+        jstate = replica_states[j]
+
+        # Reject swap attempt if any energies are nan.
+        if np.isnan(u_kl[i, jstate]) or np.isnan(u_kl[j, istate]) or np.isnan(u_kl[i, istate]) or np.isnan(u_kl[j, jstate]):
+            continue
+
+        # Compute log probability of swap in double precision, whatever the precision of u_kl.
+        log_P_accept = - (np.float64(u_kl[i, jstate]) + np.float64(u_kl[j, istate])) + (np.float64(u_kl[i, istate]) + np.float64(u_kl[j, jstate]))
+
+        # Record that this move has been proposed.
+        Nij_proposed[istate, jstate] += 1
+        Nij_proposed[jstate, istate] += 1
+
+        # Accept or reject.
+        if log_P_accept >= 0.0 or np.random.random() < np.exp(log_P_accept):
+            # Swap states in replica slots i and j.
+            replica_states[i] = jstate
+            replica_states[j] = istate
+            # Accumulate statistics
+            Nij_accepted[istate, jstate] += 1
+            Nij_accepted[jstate, istate] += 1
+
+
+_mix_all_replicas_jit = njit(cache=True)(_mix_all_replicas)
@@ -314,6 +314,27 @@ class SamplerState(object):
         else:
             context = mm.Context(self.system, integrator)
         
+        # Set box vectors, positions, and velocities.
+        self.applyToContext(context)
+
+        return context
+
+    def applyToContext(self, context):
+        """
+        Set the box vectors, positions, and velocities (if specified) of an existing OpenMM Context.
+
+        Parameters
+        ----------
+        context : simtk.openmm.Context
+           The Context to update.  Its System must be compatible with this sampler state.
+
+        Notes
+        -----
+        This allows a Context to be reused for many sampler states, rather than
+        creating a new one with createContext().
+
+        """
+
         # Set box vectors, if specified.
         if (self.box_vectors is not None): 
             try:
@@ -330,8 +351,6 @@ class SamplerState(object):
         if (self.velocities is not None): 
             context.setVelocities(self.velocities)
 
-        return context
-
     def minimize(self, tolerance=None, maxIterations=None, platform=None):
         """
         Minimize the current configuration.
@@ -371,8 +390,8 @@ class SamplerState(object):
         from simtk.openmm import LocalEnergyMinimizer
         timer.start("Context creation")
         context = self.createContext(platform=platform)
-        logger.debug("LocalEnergyMinimizer: platform is %s" % context.getPlatform().getName())
-        logger.debug("Minimizing with tolerance %s and %d max. iterations." % (tolerance, maxIterations))
+        logger.debug("LocalEnergyMinimizer: platform is %s", context.getPlatform().getName())
+        logger.debug("Minimizing with tolerance %s and %d max. iterations.", tolerance, maxIterations)
         timer.stop("Context creation")
         timer.start("LocalEnergyMinimizer minimize")
         LocalEnergyMinimizer.minimize(context, tolerance, maxIterations)
@@ -734,7 +753,7 @@ class LangevinDynamicsMove(MCMCMove):
         timer.start("Context Creation")
         context = sampler_state.createContext(integrator, platform=platform)
         timer.stop("Context Creation")
-        logger.debug("LangevinDynamicMove: Context created, platform is %s" % context.getPlatform().getName())
+        logger.debug("LangevinDynamicMove: Context created, platform is %s", context.getPlatform().getName())
 
         # Set pressure, if barostat is included.
         if barostat is not None:
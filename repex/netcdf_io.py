@@ -1,4 +1,8 @@
 import os
+import json
+import hashlib
+import atexit
+import weakref
 
 import numpy as np
 
@@ -29,6 +33,9 @@ class NetCDFDatabase(Analyzer):
     positions : list(simtk.unit)
         A list of coordinates for each repex slot.  If None, will be 
         loaded from disk.
+    compression : int, default=0
+        zlib compression level (0-9) for the per-iteration variables of a
+        new database, or 0 to store them uncompressed.  Ignored when resuming.
 
     Notes
     -----
@@ -37,28 +44,38 @@ class NetCDFDatabase(Analyzer):
     related to MBar and trajectory analysis.
     
     """
-    def __init__(self, filename, thermodynamic_states=None, positions=None):
+
+    # Per-iteration variables, from smallest to largest chunk; staged writes are flushed in this order.
+    _iteration_variables = ['timestamp', 'states', 'volumes', 'proposed', 'accepted', 'box_vectors', 'energies', 'positions']
+
+    def __init__(self, filename, thermodynamic_states=None, positions=None, compression=0):
 
         # Check if netcdf file exists.
         resume = os.path.exists(filename) and (os.path.getsize(filename) > 0)
         
         if resume:
             assert thermodynamic_states is None and positions is None, "Cannot input thermodynamic_states and positions if you are resuming from disk."
-            self.ncfile = netcdf.Dataset(filename, 'a', version='NETCDF4')
+            self.ncfile = netcdf.Dataset(filename, 'a')
 
         else:
             assert thermodynamic_states is not None and positions is not None, "Must input thermodynamic_states and coordinates if no existing database."
             assert len(thermodynamic_states) == len(positions), "Must have same number of thermodynamic_states and coordinate sets."
             
-            self.ncfile = netcdf.Dataset(filename, 'w', version='NETCDF4')
+            self.ncfile = netcdf.Dataset(filename, 'w', format='NETCDF4')
         
         self.title = "No Title."
+        self.write_buffer_size = 1  # Number of iterations of each variable that can be staged in memory by write(..., sync=False)
+        self._buffers = {}  # _buffers[key] is the preallocated (write_buffer_size, ...) staging array of a per-iteration variable
+        self._pending = {}  # _pending[key] = (first_iteration, n_staged) for the iterations staged in _buffers[key]
+        self._systems = {}  # _systems[digest] is the System deserialized from the serialized system with SHA-256 hex digest `digest`
+        _open_databases.add(self)  # Writes are no longer synced every iteration, so make sure they reach disk on exit.
         
         if resume:
             logger.info("Attempting to resume by reading thermodynamic states and options...")
+            self._cache_variables()
             self.parameters = self._load_parameters()
         else:
-            self._initialize_netcdf(thermodynamic_states, positions)
+            self._initialize_netcdf(thermodynamic_states, positions, compression=compression)
 
         # Check to make sure all states have the same number of atoms and are in the same thermodynamic ensemble.
         for state in self.thermodynamic_states:
@@ -66,7 +83,7 @@ class NetCDFDatabase(Analyzer):
                 raise ValueError("Provided ThermodynamicState states must all be from the same thermodynamic ensemble.")
 
 
-    def _initialize_netcdf(self, thermodynamic_states, positions):
+    def _initialize_netcdf(self, thermodynamic_states, positions, compression=0):
         """Initialize NetCDF file for storage by allocating arrays on disk.
         
         Parameters
@@ -78,6 +95,8 @@ class NetCDFDatabase(Analyzer):
         positions : list(simtk.unit)
             A list of coordinates for each repex slot.  If None, will be 
             loaded from disk.
+        compression : int, default=0
+            zlib compression level (0-9) for per-iteration variables, or 0 for none.
         
         """
         
@@ -92,25 +111,22 @@ class NetCDFDatabase(Analyzer):
         self.ncfile.createDimension('atom', n_atoms) # number of atoms in system
         self.ncfile.createDimension('spatial', 3) # number of spatial dimensions
 
-        # Set global attributes.
-        self.ncfile.title = self.title
-        self.ncfile.application = 'Repex'
+        # Set global attributes, including a placeholder for the ReplicaExchange (sub)class name.
         #self.ncfile.program = 'yank.py'
-        self.ncfile.programVersion = __version__
-        self.ncfile.Conventions = 'Repex'
-        self.ncfile.ConventionVersion = '0.1'
-        
-        # Allocate variable for the ReplicaExchange (sub)class name.
-        self.ncfile.repex_classname = "Unknown"
+        self.ncfile.setncatts(dict(title=self.title, application='Repex', programVersion=__version__, Conventions='Repex', ConventionVersion='0.1', repex_classname="Unknown"))
         
         # Create variables.
-        ncvar_positions = self.ncfile.createVariable('positions', 'f', ('iteration','replica','atom','spatial'))
-        ncvar_states    = self.ncfile.createVariable('states', 'i', ('iteration','replica'))
-        ncvar_energies  = self.ncfile.createVariable('energies', 'f', ('iteration','replica','replica'))        
-        ncvar_proposed  = self.ncfile.createVariable('proposed', 'l', ('iteration','replica','replica'))
-        ncvar_accepted  = self.ncfile.createVariable('accepted', 'l', ('iteration','replica','replica'))                
-        ncvar_box_vectors = self.ncfile.createVariable('box_vectors', 'f', ('iteration','replica','spatial','spatial'))        
-        ncvar_volumes  = self.ncfile.createVariable('volumes', 'f', ('iteration','replica'))
+        # Per-iteration variables are chunked one iteration per chunk, so each iteration is written as whole chunks.
+        # If requested, they are also shuffled and compressed; positions dominate the file size, and the
+        # mostly-zero proposed/accepted matrices compress very well.
+        filters = dict(zlib=True, complevel=compression, shuffle=True) if compression > 0 else {}
+        ncvar_positions = self.ncfile.createVariable('positions', 'f', ('iteration','replica','atom','spatial'), chunksizes=(1, n_replicas, n_atoms, 3), **filters)
+        ncvar_states    = self.ncfile.createVariable('states', 'i', ('iteration','replica'), chunksizes=(1, n_replicas), **filters)
+        ncvar_energies  = self.ncfile.createVariable('energies', 'f', ('iteration','replica','replica'), chunksizes=(1, n_replicas, n_replicas), **filters)
+        ncvar_proposed  = self.ncfile.createVariable('proposed', 'i', ('iteration','replica','replica'), chunksizes=(1, n_replicas, n_replicas), **filters)
+        ncvar_accepted  = self.ncfile.createVariable('accepted', 'i', ('iteration','replica','replica'), chunksizes=(1, n_replicas, n_replicas), **filters)
+        ncvar_box_vectors = self.ncfile.createVariable('box_vectors', 'f', ('iteration','replica','spatial','spatial'), chunksizes=(1, n_replicas, 3, 3), **filters)
+        ncvar_volumes  = self.ncfile.createVariable('volumes', 'f', ('iteration','replica'), chunksizes=(1, n_replicas), **filters)
         
         # Define units for variables.
         ncvar_positions.units = 'nm'
@@ -130,20 +146,44 @@ class NetCDFDatabase(Analyzer):
         ncvar_box_vectors.long_name = "box_vectors[iteration][replica][i][j] is dimension j of box vector i for replica 'replica' from iteration 'iteration-1'."
         ncvar_volumes.long_name = "volume[iteration][replica] is the box volume for replica 'replica' from iteration 'iteration-1'."
 
-        # Create timestamp variable.
-        ncvar_timestamp = self.ncfile.createVariable('timestamp', "f", ('iteration',))
+        # Create timestamp variable (POSIX time; single precision would only resolve ~2 minutes).
+        ncvar_timestamp = self.ncfile.createVariable('timestamp', 'f8', ('iteration',), chunksizes=(1024,))
+        ncvar_timestamp.units = 's'
+        ncvar_timestamp.long_name = "timestamp[iteration] is the POSIX time at which iteration 'iteration' was written."
 
         # Create group for performance statistics.
         ncgrp_timings = self.ncfile.createGroup('timings')
-        ncvar_iteration_time = ncgrp_timings.createVariable('iteration', 'f', ('iteration',)) # total iteration time (seconds)
-        ncvar_iteration_time = ncgrp_timings.createVariable('mixing', 'f', ('iteration',)) # time for mixing
-        ncvar_iteration_time = ncgrp_timings.createVariable('propagate', 'f', ('iteration','replica')) # total time to propagate each replica
+        # Timings are tiny, so many iterations share one chunk.
+        ncvar_iter_total = ncgrp_timings.createVariable('iteration', 'f', ('iteration',), chunksizes=(4096,)) # total iteration time (seconds)
+        ncvar_iter_mix = ncgrp_timings.createVariable('mixing', 'f', ('iteration',), chunksizes=(4096,)) # time for mixing
+        ncvar_iter_prop = ncgrp_timings.createVariable('propagate', 'f', ('iteration','replica'), chunksizes=(4096, n_replicas)) # total time to propagate each replica
+        for ncvar in [ncvar_iter_total, ncvar_iter_mix, ncvar_iter_prop]:
+            ncvar.units = 's'
         
+        self._cache_variables()
+
         # Store thermodynamic states using @property setter
+        # The file is synced once the owning ReplicaExchange has also stored its parameters.
         self.thermodynamic_states = thermodynamic_states
 
-        # Force sync to disk to avoid data loss.
-        self.ncfile.sync()
+
+    def _cache_variables(self):
+        """Look up the handles of the per-iteration variables once, rather than on every write and read.
+
+        Notes
+        -----
+        These variables never contain missing values, so automatic masking is
+        turned off and reads return plain ndarrays rather than masked arrays.
+        """
+        self._variables = dict((key, self.ncfile.variables[key]) for key in self._iteration_variables)
+        self._shapes = dict((key, variable.shape[1:]) for key, variable in self._variables.items())  # Shape of one iteration of each variable
+        for variable in self._variables.values():
+            variable.set_auto_mask(False)
+
+        # Let the chunk cache hold a few iterations of positions, so buffered writes don't evict each other.
+        positions = self._variables['positions']
+        chunk_bytes = positions.shape[1] * positions.shape[2] * positions.shape[3] * positions.dtype.itemsize
+        positions.set_var_chunk_cache(size=max(positions.get_var_chunk_cache()[0], 4 * chunk_bytes), nelems=521, preemption=0.75)
 
 
     @property
@@ -169,20 +209,34 @@ class NetCDFDatabase(Analyzer):
         n_states = int(ncgrp_stateinfo.variables['n_states'][:])
 
         # Read state information.
+        temperatures = ncgrp_stateinfo.variables['temperatures'][:]
+        pressures = None
+        if 'pressures' in ncgrp_stateinfo.variables:
+            pressures = ncgrp_stateinfo.variables['pressures'][:]
+
+        # Reconstitute System objects.  Parsing the XML is expensive, so each distinct
+        # system is parsed once (states often share a system) and kept for later calls.
+        ncvar_systems = ncgrp_stateinfo.variables['systems']
+        if 'system_digests' in ncgrp_stateinfo.variables:
+            digests = [str(digest) for digest in ncgrp_stateinfo.variables['system_digests'][:]]
+        else:
+            digests = [_digest(str(ncvar_systems[state_index])) for state_index in range(n_states)]
+        for state_index, digest in enumerate(digests):
+            if digest not in self._systems:
+                self._systems[digest] = str_to_system(str(ncvar_systems[state_index]))
+
         thermodynamic_states = list()
         for state_index in range(n_states):
                         
-            temperature = ncgrp_stateinfo.variables['temperatures'][state_index] * units.kelvin
+            temperature = float(temperatures[state_index]) * units.kelvin
             
             pressure = None
-            if 'pressures' in ncgrp_stateinfo.variables:
-                pressure = ncgrp_stateinfo.variables['pressures'][state_index] * units.atmospheres
+            if pressures is not None:
+                pressure = float(pressures[state_index]) * units.atmospheres
             
-            # Reconstitute System object.
-            system = str(ncgrp_stateinfo.variables['systems'][state_index])
-            system = str_to_system(system)
-            
-            state = ThermodynamicState(system=system, temperature=temperature, pressure=pressure)
+            # States with identical serialized systems share one System, rather than each holding a deep copy.
+            system = self._systems[digests[state_index]]
+            state = ThermodynamicState._fast_clone_with_system(system, temperature, pressure)
 
             thermodynamic_states.append(state)
         
@@ -210,27 +264,33 @@ class NetCDFDatabase(Analyzer):
         ncvar_temperatures = ncgrp_stateinfo.createVariable('temperatures', 'f', ('replica',))
         ncvar_temperatures.units = 'K'
         ncvar_temperatures.long_name = "temperatures[state] is the temperature of thermodynamic state 'state'"
-        for state_index in range(self.n_states):
-            ncvar_temperatures[state_index] = thermodynamic_states[state_index].temperature / units.kelvin
+        ncvar_temperatures[:] = np.array([state.temperature.value_in_unit(units.kelvin) for state in thermodynamic_states], np.float32)
 
         # Pressures.
         if thermodynamic_states[0].pressure is not None:
             ncvar_temperatures = ncgrp_stateinfo.createVariable('pressures', 'f', ('replica',))
             ncvar_temperatures.units = 'atm'
             ncvar_temperatures.long_name = "pressures[state] is the external pressure of thermodynamic state 'state'"
-            for state_index in range(self.n_states):
-                ncvar_temperatures[state_index] = thermodynamic_states[state_index].pressure / units.atmospheres
+            ncvar_temperatures[:] = np.array([state.pressure.value_in_unit(units.atmospheres) for state in thermodynamic_states], np.float32)
 
         # TODO: Store other thermodynamic variables store in ThermodynamicState?  Generalize?
                 
         # Systems.
-        ncvar_serialized_states = ncgrp_stateinfo.createVariable('systems', str, ('replica',), zlib=True)
+        # Serialized systems are highly repetitive XML, so compress them hard; shuffle doesn't help strings.
+        ncvar_serialized_states = ncgrp_stateinfo.createVariable('systems', str, ('replica',), zlib=True, complevel=9, shuffle=False)
         ncvar_serialized_states.long_name = "systems[state] is the serialized OpenMM System corresponding to the thermodynamic state 'state'"
+        ncvar_system_digests = ncgrp_stateinfo.createVariable('system_digests', str, ('replica',))
+        ncvar_system_digests.long_name = "system_digests[state] is the SHA-256 hex digest of systems[state], used to parse each distinct system only once"
+        serialized_states = np.empty(self.n_states, 'O')
+        digests = np.empty(self.n_states, 'O')
         for state_index in range(self.n_states):
-            logger.debug("Serializing state %d..." % state_index)
+            logger.debug("Serializing state %d...", state_index)
             serialized = thermodynamic_states[state_index].system.__getstate__()
-            logger.debug("Serialized state is %d B | %.3f KB | %.3f MB" % (len(serialized), len(serialized) / 1024.0, len(serialized) / 1024.0 / 1024.0))
-            ncvar_serialized_states[state_index] = serialized
+            logger.debug("Serialized state is %d B | %.3f KB | %.3f MB", len(serialized), len(serialized) / 1024.0, len(serialized) / 1024.0 / 1024.0)
+            serialized_states[state_index] = serialized
+            digests[state_index] = _digest(serialized)
+        ncvar_serialized_states[:] = serialized_states
+        ncvar_system_digests[:] = digests
 
 
     def store_parameters(self, parameters):
@@ -249,6 +309,9 @@ class NetCDFDatabase(Analyzer):
         This dictionary is the correct input here.  Eventually, this dictionary
         will be converted to a namedtuple, at which point it is immutable.  
         
+        All parameters are packed into a single JSON string variable, rather
+        than one NetCDF variable (with attributes) per parameter.
+        
         """
 
         logger.debug("Storing run parameters in NetCDF file...")
@@ -260,10 +323,39 @@ class NetCDFDatabase(Analyzer):
         # Create a group to store state information.
         ncgrp_options = self.ncfile.createGroup('options')
 
+        self._write_parameters(parameters)
+
+    def _write_parameters(self, parameters):
+        """Store all run parameters as one JSON string of name -> [value, units]."""
+        packed = {}
         for option_name, option_value in parameters.items():
-            self._store_parameter(option_name, option_value)
+            # If Quantity, strip off units first.
+            option_unit = None
+            if type(option_value) == units.Quantity:
+                option_unit = str(option_value.unit)
+                option_value = option_value / option_value.unit
+            if isinstance(option_value, np.generic):
+                option_value = option_value.item()
+            packed[option_name] = [option_value, option_unit]
+
+        ncgrp_options = self.ncfile.groups['options']
+        if 'parameters' in ncgrp_options.variables:
+            ncvar = ncgrp_options.variables['parameters']
+        else:
+            ncvar = ncgrp_options.createVariable('parameters', str, 'scalar')
+        packed_data = np.empty(1, 'O')
+        packed_data[0] = json.dumps(packed)
+        ncvar[:] = packed_data
 
     def _store_parameter(self, option_name, option_value):
+        """Store (or update) a single run parameter."""
+        if 'parameters' in self.ncfile.groups['options'].variables:
+            parameters = self._load_parameters()
+            parameters[option_name] = option_value
+            self._write_parameters(parameters)
+            return
+
+        # Databases written by older versions store one variable per parameter.
         # If Quantity, strip off units first.
         option_unit = None
         if type(option_value) == units.Quantity:
@@ -279,7 +371,7 @@ class NetCDFDatabase(Analyzer):
         if type(option_value) == bool:
             option_value = int(option_value)
         # Store the variable.
-        logger.debug("Storing option: %s -> %s (type: %s)" % (option_name, option_value, str(option_type)))
+        logger.debug("Storing option: %s -> %s (type: %s)", option_name, option_value, str(option_type))
         if type(option_value) == str:
             if option_name in self.ncfile.groups['options'].variables:
                 ncvar = self.ncfile.groups['options'].variables[option_name]
@@ -315,15 +407,12 @@ class NetCDFDatabase(Analyzer):
             return None
         
         else:
-            option_value = eval(type_name + '(' + repr(option_value) + ')')
+            option_value = _PARAMETER_TYPES[type_name](option_value)
             # If Quantity, assign units.
             if hasattr(option_ncvar, 'units'):
-                option_unit_name = getattr(option_ncvar, 'units')
-                if option_unit_name[0] == '/': option_unit_name = '1' + option_unit_name
-                option_unit = eval(option_unit_name, vars(units))
-                option_value = units.Quantity(option_value, option_unit)
+                option_value = units.Quantity(option_value, _parse_unit(getattr(option_ncvar, 'units')))
             # Store option.
-            logger.debug("Restoring option: %s -> %s (type: %s)" % (option_name, str(option_value), type(option_value)))
+            logger.debug("Restoring option: %s -> %s (type: %s)", option_name, str(option_value), type(option_value))
             #setattr(self, option_name, option_value)
             return option_value 
 
@@ -341,71 +430,178 @@ class NetCDFDatabase(Analyzer):
         ncgrp_options = self.ncfile.groups['options']
         
         options = {}
-        for option_name in ncgrp_options.variables.keys():
-            options[option_name] = self._load_parameter(option_name)
+        if 'parameters' in ncgrp_options.variables:
+            packed = json.loads(str(ncgrp_options.variables['parameters'][0]))
+            for option_name, (option_value, option_unit_name) in packed.items():
+                if option_unit_name is not None:
+                    option_value = units.Quantity(option_value, _parse_unit(option_unit_name))
+                options[str(option_name)] = option_value
+        else:
+            # Databases written by older versions store one variable per parameter.
+            for option_name in ncgrp_options.variables.keys():
+                options[option_name] = self._load_parameter(option_name)
 
         return options
 
 
     def write(self, key, value, iteration, sync=True):
-        """Write a variable to the database and sync."""
+        """Write a variable to the database and sync.
+        
+        Parameters
+        ----------
+        key : str
+            Name of the per-iteration variable to write.
+        value : np.ndarray or scalar
+            Data for a single iteration.
+        iteration : int
+            The iteration to write.
+        sync : bool, default=True
+            If False, the value is staged in memory and written to disk,
+            together with the other staged iterations, on the next sync().
+        
+        Notes
+        -----
+        
+        Staging lets consecutive iterations of a variable be written as a
+        single contiguous slab rather than one NetCDF call per iteration.
+        Values are copied into a preallocated buffer of `write_buffer_size`
+        iterations (and cast to the dtype of the variable on disk), so
+        callers may reuse their arrays.  A full buffer is written out before
+        the next iteration is staged.  A value with the wrong shape raises
+        ValueError here rather than when it is flushed.
+        """
         
-        self.ncfile.variables[key][iteration] = value
+        if np.shape(value) != self._shapes[key]:
+            raise ValueError("Cannot write %s with shape %s; expected shape %s." % (key, np.shape(value), self._shapes[key]))
+
+        slot = self.stage(key, iteration)
+        slot[...] = value
+        self.commit(key, iteration)
         
         if sync == True:
             self.sync()
 
 
+    def stage(self, key, iteration):
+        """Return the staging slot for one iteration of a per-iteration variable.
+
+        Parameters
+        ----------
+        key : str
+            Name of the per-iteration variable.
+        iteration : int
+            The iteration to stage.
+
+        Returns
+        -------
+        slot : np.ndarray
+            A view of the preallocated staging buffer of `key`, with the
+            shape and dtype of one iteration of the variable on disk.
+
+        Notes
+        -----
+
+        Fill the slot in place, then call commit(key, iteration) to stage it.
+        A slot that is never committed is not written, so a fill that fails
+        partway leaves no uninitialized data behind; the next call to
+        stage() returns the same slot.
+        """
+
+        pending = self._pending.get(key)
+        if pending is not None:
+            first_iteration, n_staged = pending
+            if (first_iteration + n_staged != iteration) or (n_staged == len(self._buffers[key])):
+                self.flush(key)  # Not contiguous with the staged iterations, or no room left.
+                pending = None
+
+        if pending is None:
+            if (key not in self._buffers) or (len(self._buffers[key]) != self.write_buffer_size):
+                self._buffers[key] = np.empty((self.write_buffer_size,) + self._shapes[key], self._variables[key].dtype)
+            n_staged = 0
+
+        return self._buffers[key][n_staged, ...]
+
+
+    def commit(self, key, iteration):
+        """Stage the slot of `key` just returned by stage(key, iteration) and filled by the caller."""
+
+        first_iteration, n_staged = self._pending.get(key, (iteration, 0))
+        self._pending[key] = (first_iteration, n_staged + 1)
+
+
+    def flush(self, key=None):
+        """Write the staged iterations of `key` (or of all variables) to the NetCDF file, without syncing it."""
+        
+        keys = [key for key in self._iteration_variables if key in self._pending] if key is None else [key]
+        for key in keys:
+            pending = self._pending.pop(key, None)
+            if pending is None:
+                continue
+            first_iteration, n_staged = pending
+            self._variables[key][first_iteration:first_iteration + n_staged] = self._buffers[key][:n_staged]
+
+
     def sync(self):
-        """Sync the database."""
+        """Write any staged iterations and sync the database."""
+        self.flush()
         self.ncfile.sync()
     
     def _finalize(self):
-        self.sync()
+        if self.ncfile.isopen():
+            self.sync()
 
     def __del__(self):
         self._finalize()
-        self.ncfile.close()
+        if self.ncfile.isopen():
+            self.ncfile.close()
 
     @property
     def positions(self):
         """Return the positions."""
-        return self.ncfile.variables['positions']
+        self.flush('positions')
+        return self._variables['positions']
 
     @property
     def box_vectors(self):
         """Return the box vectors."""
-        return self.ncfile.variables['box_vectors']
+        self.flush('box_vectors')
+        return self._variables['box_vectors']
                     
     @property
     def volumes(self):
         """Return the volumes."""
-        return self.ncfile.variables['volumes']
+        self.flush('volumes')
+        return self._variables['volumes']
 
     @property
     def states(self):
         """Return the state indices."""
-        return self.ncfile.variables['states']
+        self.flush('states')
+        return self._variables['states']
         
     @property
     def energies(self):
         """Return the energies."""
-        return self.ncfile.variables['energies']
+        self.flush('energies')
+        return self._variables['energies']
                                     
     @property
     def proposed(self):
         """Return the proposed moves."""
-        return self.ncfile.variables['proposed']
+        self.flush('proposed')
+        return self._variables['proposed']
         
     @property
     def accepted(self):
         """Return the accepted moves."""
-        return self.ncfile.variables['accepted']
+        self.flush('accepted')
+        return self._variables['accepted']
 
     @property
     def timestamp(self):
         """Return the timestamp."""
-        return self.ncfile.variables['timestamp']
+        self.flush('timestamp')
+        return self._variables['timestamp']
 
     @property
     def repex_classname(self):
@@ -434,11 +630,9 @@ class NetCDFDatabase(Analyzer):
         
         iteration = self.last_iteration
         
-        replica_box_vectors = list()
-        for replica_index in range(self.n_states):
-            x = self.ncfile.variables['box_vectors'][iteration, replica_index,:,:].astype(np.float64).copy()
-            box_vectors = units.Quantity(x, units.nanometers)
-            replica_box_vectors.append(box_vectors)        
+        # Read all replicas in one slab; each replica gets a view of it.
+        x = self.box_vectors[iteration].astype(np.float64)
+        replica_box_vectors = [units.Quantity(x[replica_index], units.nanometers) for replica_index in range(self.n_states)]
         
         return replica_box_vectors
         
@@ -454,7 +648,7 @@ class NetCDFDatabase(Analyzer):
             The coordinates of each replica
         """
         iteration = self.last_iteration
-        return self.energies[iteration,:].copy()
+        return self.energies[iteration,:]  # Reads return a new array, so no copy is needed
 
     
     @property
@@ -487,11 +681,9 @@ class NetCDFDatabase(Analyzer):
         
         iteration = self.last_iteration
         
-        replica_coordinates = list()
-        for replica_index in range(self.n_states):
-            x = self.positions[iteration, replica_index, :, :].astype(np.float64).copy()
-            coordinates = units.Quantity(x, units.nanometers)
-            replica_coordinates.append(coordinates)
+        # Read all replicas in one slab; each replica gets a view of it.
+        x = self.positions[iteration].astype(np.float64)
+        replica_coordinates = [units.Quantity(x[replica_index], units.nanometers) for replica_index in range(self.n_states)]
         
         return replica_coordinates
 
@@ -500,7 +692,7 @@ class NetCDFDatabase(Analyzer):
     def last_replica_states(self):
         
         iteration = self.last_iteration
-        return self.states[iteration,:].copy()
+        return self.states[iteration,:]
 
 
     @property
@@ -511,3 +703,46 @@ class NetCDFDatabase(Analyzer):
     @property
     def n_atoms(self):
         return self.positions.shape[2]
+
+
+# Databases still alive, synced by a single handler when the interpreter exits.
+_open_databases = weakref.WeakSet()
+
+
+def _sync_at_exit():
+    """Sync every NetCDFDatabase that is still alive when the interpreter exits."""
+    for database in list(_open_databases):
+        database._finalize()
+
+
+atexit.register(_sync_at_exit)
+
+
+def _digest(serialized):
+    """Return the SHA-256 hex digest of a serialized System."""
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+
+# Casts for the Python type names stored with each parameter by older databases.
+_PARAMETER_TYPES = {
+    "int": int,
+    "long": int,
+    "float": float,
+    "bool": lambda value: bool(int(value)),
+    "str": str,
+    "unicode": str,
+    "int32": int,
+    "int64": int,
+    "float32": float,
+    "float64": float,
+}
+
+_units_cache = {}  # _units_cache[unit_name] is the simtk unit parsed from unit_name
+
+
+def _parse_unit(unit_name):
+    """Return the simtk unit named by `unit_name`, as written by str(unit)."""
+    if unit_name not in _units_cache:
+        expression = '1' + unit_name if unit_name[0] == '/' else unit_name
+        _units_cache[unit_name] = eval(expression, {"__builtins__": {}}, vars(units))  # Only names from simtk.unit are visible
+    return _units_cache[unit_name]
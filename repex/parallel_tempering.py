@@ -1,12 +1,17 @@
 import time
+import hashlib
 
 import numpy as np
 
+import simtk.openmm as mm
+import simtk.unit as units
+
 from repex.thermodynamics import ThermodynamicState
 from repex import replica_exchange
 from repex.replica_exchange import ReplicaExchange
 from repex import netcdf_io
 from repex.mcmc import SamplerState
+from repex.timing import benchmark
 
 import logging
 logger = logging.getLogger(__name__)
@@ -32,25 +37,116 @@ class ParallelTempering(ReplicaExchange):
     
     """
 
-    def __init__(self, thermodynamic_states, sampler_states=None, database=None, mpicomm=None, platform=None, parameters={}):
-        self._check_self_consistency(thermodynamic_states)
+    def __init__(self, thermodynamic_states, sampler_states=None, database=None, mpicomm=None, platform=None, parameters={}, _skip_consistency_check=False):
+        if not _skip_consistency_check:  # create() builds states that are consistent by construction
+            self._check_self_consistency(thermodynamic_states)
+        # Temperatures are fixed, so the inverse temperature of each state (in mol/kJ) is computed once,
+        # in plain floats rather than with Quantity arithmetic per state.
+        self._temperatures = np.array([state.temperature.value_in_unit(units.kelvin) for state in thermodynamic_states])
+        self._betas = 1.0 / (kB.value_in_unit(units.kilojoules_per_mole / units.kelvin) * self._temperatures)
+        self._potential_energies = np.empty(len(thermodynamic_states))  # Reused by _compute_energies(), in kJ/mol
+        self._replica_contexts = {}  # _replica_contexts[replica_index] is the (context, integrator) that holds that replica on the device
+        self._resident = {}  # _resident[replica_index] is the (sampler_state, positions) last produced by that replica's context
         super(ParallelTempering, self).__init__(thermodynamic_states, sampler_states=sampler_states, database=database, mpicomm=mpicomm, platform=platform, parameters=parameters)
 
     def _check_self_consistency(self, thermodynamic_states):
         """Checks that each state is identical except for the temperature, as required for ParallelTempering."""
 
-        for s0 in thermodynamic_states:
-            for s1 in thermodynamic_states:
-                if s0.pressure != s1.pressure:
-                    raise(ValueError("For ParallelTempering, ThermodynamicState objects cannot have different pressures!"))
+        # Equality is transitive, so it suffices to compare every state with the first one.
+        s0 = thermodynamic_states[0]
+        for s1 in thermodynamic_states[1:]:
+            if s0.pressure != s1.pressure:
+                raise(ValueError("For ParallelTempering, ThermodynamicState objects cannot have different pressures!"))
 
+        # States built by create() without a pressure, or restored from a database, share one System object,
+        # so there is nothing to serialize.
+        if all(s1.system is s0.system for s1 in thermodynamic_states):
+            return
 
         with IgnoreBarostat(thermodynamic_states):  # Allows us to compare state equality modulo barostat temperature and RNG seed; see class definition below.
             
-            for s0 in thermodynamic_states:
-                for s1 in thermodynamic_states:
-                    if s0.system.__getstate__() != s1.system.__getstate__():
-                        raise(ValueError("For ParallelTempering, ThermodynamicState objects cannot have different systems!"))
+            # Keep only a digest of each distinct System's XML, rather than every (possibly very large) serialization.
+            digests = {id(s0.system): _system_digest(s0.system)}  # digests[id(system)] is the SHA-256 digest of system.__getstate__()
+            for s1 in thermodynamic_states[1:]:
+                if id(s1.system) not in digests:
+                    digests[id(s1.system)] = _system_digest(s1.system)
+                if digests[id(s1.system)] != digests[id(s0.system)]:
+                    raise(ValueError("For ParallelTempering, ThermodynamicState objects cannot have different systems!"))
+
+
+    @benchmark
+    def _propagate_replica(self, replica_index):
+        """Propagate the replica corresponding to the specified replica index.
+
+        Parameters
+        ----------
+        
+        replica_index : int
+            The replica to propagate
+
+        Notes
+        -----
+
+        All states share the same System, so for constant-volume simulations
+        each replica keeps its own Context and only the integrator temperature
+        follows the replica's current state.  The replica's configuration is
+        uploaded only if the Context does not already hold it.  With a barostat,
+        whose temperature is part of the System, the per-state Contexts of
+        ReplicaExchange are used instead.
+
+        Under MPI the replicas a node propagates change as states are exchanged,
+        so the Context of a replica that has moved to another node is handed
+        to the next new replica rather than kept (see _release_context()).
+        """
+
+        state_index = self.replica_states[replica_index]
+        thermodynamic_state = self.thermodynamic_states[state_index]
+
+        if (thermodynamic_state.pressure is not None) or (not self.parameters.cache_contexts):
+            return super(ParallelTempering, self)._propagate_replica(replica_index)
+
+        if replica_index not in self._replica_contexts:
+            self._replica_contexts[replica_index] = self._release_context() or self._create_context(thermodynamic_state)
+        context, integrator = self._replica_contexts[replica_index]
+
+        sampler_state = self.sampler_states[replica_index]
+        resident_state, resident_positions = self._resident.get(replica_index, (None, None))
+        if (sampler_state is not resident_state) or (sampler_state.positions is not resident_positions):
+            sampler_state.applyToContext(context)
+
+        integrator.setTemperature(thermodynamic_state.temperature)
+        integrator.setStepSize(self.current_timestep)
+        integrator.step(self.parameters.nsteps_per_iteration)
+
+        sampler_state = SamplerState.createFromContext(context)
+        self.sampler_states[replica_index] = sampler_state
+        self._resident[replica_index] = (sampler_state, sampler_state.positions)
+
+
+    def _release_context(self):
+        """Take the (context, integrator) of a replica that this node no longer propagates.
+
+        Returns
+        -------
+
+        context_and_integrator : tuple or None
+            The released pair, or None if every cached Context belongs to a
+            replica currently at one of this node's states.
+
+        Notes
+        -----
+
+        A node propagates the replicas at states rank, rank + size, ...; only
+        those replicas keep their Contexts.  Reusing released Contexts bounds the
+        cache to the number of states per node, however often replicas move.
+        """
+
+        for replica_index in self._replica_contexts:
+            if self.replica_states[replica_index] % self.mpicomm.size != self.mpicomm.rank:
+                self._resident.pop(replica_index, None)
+                return self._replica_contexts.pop(replica_index)
+
+        return None
 
 
     def _compute_energies(self):
@@ -60,23 +156,26 @@ class ParallelTempering(ReplicaExchange):
         -----
 
         Because only the temperatures differ among replicas, we replace 
-        the generic O(N^2) replica-exchange implementation with an O(N) implementation.
+        the generic O(N^2) replica-exchange implementation with an O(N) implementation:
+        u_kl[replica, state] = beta[state] * U[replica], with U the potential energy of each replica.
         """
 
-        start_time = time.time()
-        logger.debug("Computing energies...")
+        debug = logger.isEnabledFor(logging.DEBUG)  # Only time this when the timing will be logged.
+        if debug:
+            start_time = time.time()
+            logger.debug("Computing energies...")
                 
-        for replica_index in range(self.n_states):
-            potential_energy = self.sampler_states[replica_index].potential_energy
-            for state_index in range(self.n_states):
-                # Compute reduced potential
-                beta = 1.0 / (kB * self.thermodynamic_states[state_index].temperature)
-                self.u_kl[replica_index,state_index] = beta * potential_energy
+        # u_kl[replica, state] = beta[state] * U[replica], so the whole matrix is one outer product.
+        potential_energies = self._potential_energies
+        for replica_index, sampler_state in enumerate(self.sampler_states):
+            potential_energies[replica_index] = sampler_state.potential_energy.value_in_unit(units.kilojoules_per_mole)
+        np.multiply.outer(potential_energies, self._betas, out=self.u_kl)  # Written in place, without a temporary matrix
 
-        end_time = time.time()
-        elapsed_time = end_time - start_time
-        time_per_energy = elapsed_time / float(self.n_states)
-        logger.debug("Time to compute all energies %.3f s (%.3f per energy calculation).\n" % (elapsed_time, time_per_energy))
+        if debug:
+            end_time = time.time()
+            elapsed_time = end_time - start_time
+            time_per_energy = elapsed_time / float(self.n_states)
+            logger.debug("Time to compute all energies %.3f s (%.3f per energy calculation).", elapsed_time, time_per_energy)
 
 
     @classmethod
@@ -89,7 +188,8 @@ class ParallelTempering(ReplicaExchange):
         system : simtk.openmm.System
             The temperature of the system.
         coordinates : list([simtk.unit.Quantity]), shape=(n_replicas, n_atoms, 3), unit=Length
-            The starting coordinates for each replica
+            The starting coordinates for each replica, or a single set of
+            coordinates shared by all replicas
         filename : string 
             name of NetCDF file to bind to for simulation output and checkpointing
         T_min : simtk.unit.Quantity, unit=Temperature, default=None
@@ -122,21 +222,28 @@ class ParallelTempering(ReplicaExchange):
             logger.info("Using provided temperatures")
             n_temps = len(temperatures)
         elif (T_min is not None) and (T_max is not None) and (n_temps is not None):
-            temperatures = [ T_min + (T_max - T_min) * (np.exp(float(i) / float(n_temps-1)) - 1.0) / (np.e - 1.0) for i in range(n_temps) ]
+            factors = (np.exp(np.arange(n_temps) / float(n_temps - 1)) - 1.0) / (np.e - 1.0)
+            temperatures = [ T_min + (T_max - T_min) * factor for factor in factors ]
         else:
             raise ValueError("Either 'temperatures' or 'T_min', 'T_max', and 'n_temps' must be provided.")
 
-        thermodynamic_states = [ ThermodynamicState(system=system, temperature=temperatures[i], pressure=pressure) for i in range(n_temps) ]
+        if pressure is None:
+            # Only the temperature differs among states, so they all share the first state's copy of the System.
+            reference_state = ThermodynamicState(system=system, temperature=temperatures[0])
+            thermodynamic_states = [reference_state] + [ ThermodynamicState._fast_clone_with_system(reference_state.system, temperatures[i]) for i in range(1, n_temps) ]
+        else:
+            # The barostat temperature is part of the System, so each state needs its own copy.
+            thermodynamic_states = [ ThermodynamicState(system=system, temperature=temperatures[i], pressure=pressure) for i in range(n_temps) ]
     
         coordinates = replica_exchange.validate_coordinates(coordinates, thermodynamic_states)    
     
         if mpicomm is None or (mpicomm.rank == 0):
-            database = netcdf_io.NetCDFDatabase(filename, thermodynamic_states, coordinates)  # To do: eventually use factory for looking up database type via filename
+            database = netcdf_io.NetCDFDatabase(filename, thermodynamic_states, coordinates, compression=parameters.get("netcdf_compression", cls.default_parameters["netcdf_compression"]))  # To do: eventually use factory for looking up database type via filename
         else:
             database = None
         
         sampler_states = [SamplerState(thermodynamic_states[k].system, coordinates[k], platform=platform) for k in range(len(thermodynamic_states))]
-        repex = cls(thermodynamic_states, sampler_states, database, mpicomm=mpicomm, platform=platform, parameters=parameters)
+        repex = cls(thermodynamic_states, sampler_states, database, mpicomm=mpicomm, platform=platform, parameters=parameters, _skip_consistency_check=True)
 
         # Override title.
         repex.title = 'Parallel tempering simulation created using ParallelTempering class of repex.py on %s' % time.asctime(time.localtime())        
@@ -145,6 +252,11 @@ class ParallelTempering(ReplicaExchange):
         return repex
 
 
+def _system_digest(system):
+    """Return the SHA-256 digest of the serialized System."""
+    return hashlib.sha256(system.__getstate__().encode('utf-8')).digest()
+
+
 class IgnoreBarostat(object):
     """A context manager that temporarily disables the barostat temperature
     and random seed, for testing get_state() equality.
@@ -171,10 +283,10 @@ class IgnoreBarostat(object):
         forces = state.system.getForces()
         num_barostats = 0
         for f in forces:
-            if f.__class__.__name__ == "MonteCarloBarostat":
-                temperature = f.getTemperature()            
-                seed = f.getRandomNumberSeed()
+            if isinstance(f, mm.MonteCarloBarostat):
                 num_barostats += 1
+                if num_barostats > 1:
+                    break
 
         if num_barostats > 1:
             raise(ValueError("Found multiple barostats!"))
@@ -182,54 +294,52 @@ class IgnoreBarostat(object):
         return num_barostats
 
 
-    def get_barostat_state(self, state):
+    def get_barostat_state(self, barostat):
         """Return temperature and seed from the barostat."""
         
         if self.num_barostats <= 0:
             raise(ValueError("Found no barostats!"))
         
-        forces = state.system.getForces()
-        for f in forces:
-            if f.__class__.__name__ == "MonteCarloBarostat":
-                temperature = f.getTemperature()            
-                seed = f.getRandomNumberSeed()
-        
-        return temperature, seed
+        return barostat.getTemperature(), barostat.getRandomNumberSeed()
 
-    def set_barostat_state(self, state, temperature, seed):
-        """Set the temperature and seed from the barostat."""
+    def set_barostat_state(self, barostat, temperature, seed):
+        """Set the temperature and seed of the barostat."""
         
         if self.num_barostats <= 0:
             raise(ValueError("Found no barostats!"))
                 
-        forces = state.system.getForces()
-        for f in forces:
-            if f.__class__.__name__ == "MonteCarloBarostat":
-                f.setTemperature(temperature)
-                f.setRandomNumberSeed(seed)
+        barostat.setTemperature(temperature)
+        barostat.setRandomNumberSeed(seed)
     
     
     def __init__(self, thermodynamic_states):
         
-        num_barostats = np.array([self.get_num_barostats(state) for state in thermodynamic_states])
-        assert num_barostats.min() == num_barostats.max()
-        self.num_barostats = num_barostats[0]
+        num_barostats = set(self.get_num_barostats(state) for state in thermodynamic_states)
+        assert len(num_barostats) == 1
+        self.num_barostats = num_barostats.pop()
         
         self.thermodynamic_states = thermodynamic_states
+        
+        # Look up the barostat of each distinct System once, rather than scanning its forces on every get and set.
+        # States sharing a System share its barostat, which must be saved and restored only once.
+        systems = dict((id(state.system), state.system) for state in thermodynamic_states)
+        self._barostats = [next((f for f in system.getForces() if isinstance(f, mm.MonteCarloBarostat)), None) for system in systems.values()]
 
     
     def __enter__(self):
-        self.temperatures = []
-        self.seeds = []
+        # Saved values, one per barostat; seeds stay Python ints for the SWIG setters.
+        self.temperatures = [None] * len(self._barostats)
+        self.seeds = [None] * len(self._barostats)
         if self.num_barostats > 0:
-            for k, state in enumerate(self.thermodynamic_states):
-                temperature, seed = self.get_barostat_state(state)
-                logger.debug("Initial: State %d temperature and random seed are %s %s" % (k, temperature, seed))
-                self.temperatures.append(temperature)
-                self.seeds.append(seed)
-                self.set_barostat_state(state, 1, 1)
-                temperature, seed = self.get_barostat_state(state)
-                logger.debug("Intermediate: State %d temperature and random seed are %s %s" % (k, temperature, seed))
+            for k, barostat in enumerate(self._barostats):
+                temperature, seed = self.get_barostat_state(barostat)
+                logger.debug("Initial: Barostat %d temperature and random seed are %s %s", k, temperature, seed)
+                self.temperatures[k] = temperature
+                self.seeds[k] = seed
+                self.set_barostat_state(barostat, 1, 1)
+                if logger.isEnabledFor(logging.DEBUG):  # Reading the barostat back is only needed for the log.
+                    temperature, seed = self.get_barostat_state(barostat)
+                    logger.debug("Intermediate: Barostat %d temperature and random seed are %s %s", k, temperature, seed)
             
             
         return self
@@ -237,10 +347,8 @@ class IgnoreBarostat(object):
     
     def __exit__(self, ty, val, tb):
         if self.num_barostats > 0:
-            for k, state in enumerate(self.thermodynamic_states):
-                temperature = self.temperatures[k]
-                seed = self.seeds[k]
-                self.set_barostat_state(state, temperature, seed)
-                logger.debug("Final: State %d temperature and random seed are %s %s" % (k, temperature, seed))
+            for k, (barostat, temperature, seed) in enumerate(zip(self._barostats, self.temperatures, self.seeds)):
+                self.set_barostat_state(barostat, temperature, seed)
+                logger.debug("Final: Barostat %d temperature and random seed are %s %s", k, temperature, seed)
 
         return False
@@ -3,17 +3,17 @@ import datetime
 
 import numpy as np
 import pandas as pd
-import copy
 
+import simtk.openmm as mm
 import simtk.unit as units
 
-from repex import thermodynamics
 from repex.utils import find_matching_subclass, dict_to_named_tuple
 from repex.timing import benchmark
 from repex.mcmc import SamplerState
 from repex import mcmc
 from repex import citations
 from repex import netcdf_io
+from repex import kernels
 from repex.version import version as __version__
 from repex import dummympi
 
@@ -40,6 +40,10 @@ class ReplicaExchange(object):
     default_parameters["show_energies"] = True
     default_parameters["show_mixing_statistics"] = True
     default_parameters["integrator"] = None
+    default_parameters["write_buffer_size"] = 1 # number of iterations to hold in memory between writes to the database
+    default_parameters["sync_interval"] = 50 # number of iterations between syncs of the database to disk
+    default_parameters["cache_contexts"] = True # if True, keep one Context per thermodynamic state for propagation
+    default_parameters["netcdf_compression"] = 1 # zlib compression level for stored per-iteration data (0 disables compression)
 
     def __init__(self, thermodynamic_states, sampler_states=None, database=None, mpicomm=None, platform=None, parameters={}):
         """Create a ReplicaExchange simulation object.
@@ -74,6 +78,7 @@ class ReplicaExchange(object):
 
         self.platform = platform
         self.database = database
+        self._contexts = {}  # _contexts[state_index] is the (context, integrator) used to propagate replicas at that state
         self.thermodynamic_states = thermodynamic_states
                 
         self.n_states = len(self.thermodynamic_states)
@@ -104,10 +109,12 @@ class ReplicaExchange(object):
                 raise ValueError("Provided ThermodynamicState states must all be from the same thermodynamic ensemble.")
         
         if self.database is not None:
+            self.database.write_buffer_size = self.parameters.write_buffer_size
             self.database.ncfile.repex_classname = self.__class__.__name__
             # Eventually, we might want to wrap a setter around the ncfile
+            self.database.sync()  # One sync for the states, parameters and class name written during initialization
 
-        logger.debug("Initialized node %d / %d" % (self.mpicomm.rank, self.mpicomm.size))
+        logger.debug("Initialized node %d / %d", self.mpicomm.rank, self.mpicomm.size)
         citations.display_citations(self.parameters.replica_mixing_scheme, self.parameters.online_analysis)
 
     def process_parameters(self, parameters):
@@ -196,13 +203,14 @@ class ReplicaExchange(object):
             positions, replica_states, u_kl, Nij_proposed, Nij_accepted, parameters, iteration = None, None, None, None, None, None, None
 
         positions = self.mpicomm.bcast(positions, root=0)
-        self.replica_states = self.mpicomm.bcast(replica_states, root=0)
-        self.u_kl = self.mpicomm.bcast(u_kl, root=0)
+        self.replica_states = np.array(self.mpicomm.bcast(replica_states, root=0), np.int64)  # Plain ndarrays, rather than netCDF masked arrays
+        self.u_kl = np.array(self.mpicomm.bcast(u_kl, root=0), np.float64)
         self.iteration = self.mpicomm.bcast(iteration, root=0)
-        self.Nij_proposed = self.mpicomm.bcast(Nij_proposed, root=0)
-        self.Nij_accepted = self.mpicomm.bcast(Nij_accepted, root=0)
+        self.Nij_proposed = np.array(self.mpicomm.bcast(Nij_proposed, root=0), np.int64)
+        self.Nij_accepted = np.array(self.mpicomm.bcast(Nij_accepted, root=0), np.int64)
         
         self.parameters = self.mpicomm.bcast(parameters, root=0)  # Send out as dictionary
+        self.parameters = self.process_parameters(self.parameters)  # Fill in parameters missing from older databases
         self.parameters = dict_to_named_tuple(self.parameters)  # Convert to named_tuple for const-ness
         self._check_run_parameter_consistency()
         
@@ -223,7 +231,7 @@ class ReplicaExchange(object):
         run_start_time = time.time()              
         run_start_iteration = self.iteration
         while (self.iteration < self.parameters.number_of_iterations):
-            logger.debug("\nIteration %d / %d" % (self.iteration + 1, self.parameters.number_of_iterations))
+            logger.debug("\nIteration %d / %d", self.iteration + 1, self.parameters.number_of_iterations)
             initial_time = time.time()
 
             # Attempt replica swaps to sample from equilibrium permuation of states associated with replicas.
@@ -250,13 +258,14 @@ class ReplicaExchange(object):
             self._show_mixing_statistics()
 
             # Show timing statistics.
-            final_time = time.time()
-            elapsed_time = final_time - initial_time
-            estimated_time_remaining = (final_time - run_start_time) / (self.iteration - run_start_iteration) * (self.parameters.number_of_iterations - self.iteration)
-            estimated_total_time = (final_time - run_start_time) / (self.iteration - run_start_iteration) * (self.parameters.number_of_iterations)
-            estimated_finish_time = final_time + estimated_time_remaining
-            logger.debug("Iteration took %.3f s." % elapsed_time)
-            logger.debug("Estimated completion in %s, at %s (consuming total wall clock time %s)." % (str(datetime.timedelta(seconds=estimated_time_remaining)), time.ctime(estimated_finish_time), str(datetime.timedelta(seconds=estimated_total_time))))
+            if logger.isEnabledFor(logging.DEBUG):
+                final_time = time.time()
+                elapsed_time = final_time - initial_time
+                estimated_time_remaining = (final_time - run_start_time) / (self.iteration - run_start_iteration) * (self.parameters.number_of_iterations - self.iteration)
+                estimated_total_time = (final_time - run_start_time) / (self.iteration - run_start_iteration) * (self.parameters.number_of_iterations)
+                estimated_finish_time = final_time + estimated_time_remaining
+                logger.debug("Iteration took %.3f s.", elapsed_time)
+                logger.debug("Estimated completion in %s, at %s (consuming total wall clock time %s).", str(datetime.timedelta(seconds=estimated_time_remaining)), time.ctime(estimated_finish_time), str(datetime.timedelta(seconds=estimated_total_time)))
             
             # Perform sanity checks to see if we should terminate here.
             self._run_sanity_checks()
@@ -269,7 +278,7 @@ class ReplicaExchange(object):
         """Allocate the in-memory numpy arrays."""
   
         self.replica_states     = np.arange(self.n_states)  # replica_states[i] is the state that replica i is currently at
-        self.u_kl               = np.zeros([self.n_states, self.n_states], np.float32)        
+        self.u_kl               = np.zeros([self.n_states, self.n_states], np.float64)  # Double precision in memory; stored as float32        
         self.Nij_proposed       = np.zeros([self.n_states, self.n_states], np.int64) # Nij_proposed[i][j] is the number of swaps proposed between states i and j, prior of 1
         self.Nij_accepted       = np.zeros([self.n_states, self.n_states], np.int64) # Nij_proposed[i][j] is the number of swaps proposed between states i and j, prior of 1    
         
@@ -327,16 +336,78 @@ class ReplicaExchange(object):
 
         # Retrieve state.
         state_index = self.replica_states[replica_index] # index of thermodynamic state that current replica is assigned to
-        thermodynamic_state = self.thermodynamic_states[state_index] # thermodynamic state
         sampler_state = self.sampler_states[replica_index]
         
-        # HACK: Use Langevin dynamics move.
-        move_set = [mcmc.LangevinDynamicsMove(nsteps=self.parameters.nsteps_per_iteration, timestep=self.current_timestep, collision_rate=self.parameters.collision_rate)]
+        # HACK: Use Langevin dynamics, reusing the Context of this thermodynamic state.
+        context, integrator = self._get_context(state_index)
+        integrator.setStepSize(self.current_timestep)
+        sampler_state.applyToContext(context)
+        integrator.step(self.parameters.nsteps_per_iteration)
 
-        sampler = mcmc.MCMCSampler(thermodynamic_state, move_set=move_set, platform=self.platform)
-        new_sampler_state = sampler.run(sampler_state)
+        self.sampler_states[replica_index] = SamplerState.createFromContext(context)
+
+        if not self.parameters.cache_contexts:
+            del self._contexts[state_index]
+
+
+    def _get_context(self, state_index):
+        """Return the (context, integrator) used to propagate replicas at the specified state.
+
+        Parameters
+        ----------
         
-        self.sampler_states[replica_index] = new_sampler_state
+        state_index : int
+            The thermodynamic state index
+
+        Notes
+        -----
+
+        The Context and LangevinIntegrator are created on first use and 
+        cached, so that subsequent iterations only upload the replica's
+        box vectors, positions, and velocities.
+
+        """
+
+        if state_index not in self._contexts:
+            self._contexts[state_index] = self._create_context(self.thermodynamic_states[state_index])
+            logger.debug("Created Context for state %d", state_index)
+
+        return self._contexts[state_index]
+
+
+    def _create_context(self, thermodynamic_state):
+        """Create a (context, integrator) pair for Langevin dynamics in the specified thermodynamic state.
+
+        Notes
+        -----
+
+        The Context is built from the System of the thermodynamic state, not
+        from the System of the sampler state being propagated, so a replica
+        always evolves under the Hamiltonian of its current state.  This is
+        what the MCMCSampler previously used here did as well (it replaced the
+        sampler state's System by the thermodynamic state's), and is what
+        HamiltonianExchange requires.  The System itself is left untouched:
+        its barostat temperature was set when the state was created, and the
+        pressure is set as a Context parameter.
+        """
+
+        integrator = mm.LangevinIntegrator(thermodynamic_state.temperature, self.parameters.collision_rate, self.current_timestep)
+        integrator.setRandomNumberSeed(np.random.randint(mcmc._RANDOM_SEED_MAX))
+        
+        if self.platform:
+            context = mm.Context(thermodynamic_state.system, integrator, self.platform)
+        else:
+            context = mm.Context(thermodynamic_state.system, integrator)
+
+        # Set pressure, if barostat is included.
+        if thermodynamic_state.pressure is not None:
+            for force in thermodynamic_state.system.getForces():
+                if isinstance(force, mm.MonteCarloBarostat):
+                    context.setParameter(force.Pressure(), thermodynamic_state.pressure)
+
+        logger.debug("Context platform is %s", context.getPlatform().getName())
+        
+        return context, integrator
 
 
     def _propagate_replicas_mpi(self):
@@ -355,7 +426,7 @@ class ReplicaExchange(object):
         """
 
         # Propagate all replicas.
-        logger.debug("Propagating all replicas for %.3f ps..." % (self.parameters.nsteps_per_iteration * self.parameters.timestep / units.picoseconds))
+        logger.debug("Propagating all replicas for %.3f ps...", self.parameters.nsteps_per_iteration * self.parameters.timestep.value_in_unit(units.picoseconds))
 
         # Run just this node's share of states.
         logger.debug("Running trajectories...")
@@ -364,7 +435,7 @@ class ReplicaExchange(object):
         replica_lookup = dict( (self.replica_states[replica_index], replica_index) for replica_index in range(self.n_states) ) # replica_lookup[state_index] is the replica index currently at state 'state_index' # Python 2.6 compatible
         replica_indices = [ replica_lookup[state_index] for state_index in range(self.mpicomm.rank, self.n_states, self.mpicomm.size) ] # list of replica indices for this node to propagate
         for replica_index in replica_indices:
-            logger.debug("Node %3d/%3d propagating replica %3d state %3d..." % (self.mpicomm.rank, self.mpicomm.size, replica_index, self.replica_states[replica_index]))
+            logger.debug("Node %3d/%3d propagating replica %3d state %3d...", self.mpicomm.rank, self.mpicomm.size, replica_index, self.replica_states[replica_index])
             self._propagate_replica(replica_index)
         end_time = time.time()        
         elapsed_time = end_time - start_time
@@ -375,8 +446,8 @@ class ReplicaExchange(object):
             end_time = time.time()        
             elapsed_time = end_time - start_time
             barrier_wait_times = elapsed_time - node_elapsed_times
-            logger.debug("Running trajectories: elapsed time %.3f s (barrier time min %.3f s | max %.3f s | avg %.3f s)" % (elapsed_time, barrier_wait_times.min(), barrier_wait_times.max(), barrier_wait_times.mean()))
-            logger.debug("Total time spent waiting for GPU: %.3f s" % (node_elapsed_times.sum()))
+            logger.debug("Running trajectories: elapsed time %.3f s (barrier time min %.3f s | max %.3f s | avg %.3f s)", elapsed_time, barrier_wait_times.min(), barrier_wait_times.max(), barrier_wait_times.mean())
+            logger.debug("Total time spent waiting for GPU: %.3f s", node_elapsed_times.sum())
 
         # Send final configurations and box vectors back to all nodes.
         if (self.mpicomm.rank == 0):
@@ -387,11 +458,13 @@ class ReplicaExchange(object):
         
         sampler_states_gather = self.mpicomm.allgather([self.sampler_states[replica_index] for replica_index in replica_indices ])
         for (source, replica_indices) in enumerate(replica_indices_gather):
+            if source == self.mpicomm.rank:
+                continue  # Keep this node's own sampler states rather than their received copies.
             for (index, replica_index) in enumerate(replica_indices):
                 self.sampler_states[replica_index] = sampler_states_gather[source][index]
 
         end_time = time.time()
-        logger.debug("Synchronizing configurations and box vectors: elapsed time %.3f s" % (end_time - start_time))
+        logger.debug("Synchronizing configurations and box vectors: elapsed time %.3f s", end_time - start_time)
 
         
     def _propagate_replicas(self):
@@ -409,8 +482,8 @@ class ReplicaExchange(object):
         end_time = time.time()
         elapsed_time = end_time - start_time
         time_per_replica = elapsed_time / float(self.n_states)
-        ns_per_day = self.parameters.timestep * self.parameters.nsteps_per_iteration / time_per_replica * 24*60*60 / units.nanoseconds
-        logger.debug("Time to propagate all replicas: %.3f s (%.3f per replica, %.3f ns/day)." % (elapsed_time, time_per_replica, ns_per_day))
+        ns_per_day = self.parameters.timestep.value_in_unit(units.nanoseconds) * self.parameters.nsteps_per_iteration / time_per_replica * 24*60*60
+        logger.debug("Time to propagate all replicas: %.3f s (%.3f per replica, %.3f ns/day).", elapsed_time, time_per_replica, ns_per_day)
 
 
     def _minimize_all_replicas(self):
@@ -430,7 +503,7 @@ class ReplicaExchange(object):
         self.current_timestep = self.parameters.equilibration_timestep
         
         for iteration in range(self.parameters.number_of_equilibration_iterations):
-            logger.debug("equilibration iteration %d / %d" % (iteration, self.parameters.number_of_equilibration_iterations))
+            logger.debug("equilibration iteration %d / %d", iteration, self.parameters.number_of_equilibration_iterations)
             self._propagate_replicas()
         
         self.current_timestep = self.parameters.timestep
@@ -451,17 +524,22 @@ class ReplicaExchange(object):
                 self.u_kl[replica_index,state_index] = self.thermodynamic_states[state_index].reduced_potential(self.sampler_states[replica_index].positions, box_vectors=self.sampler_states[replica_index].box_vectors, platform=self.platform)
 
         # Send final energies to all nodes.
+        self._gather_energies()
+
+        end_time = time.time()
+        elapsed_time = end_time - start_time
+        time_per_energy= elapsed_time / float(self.n_states)**2 
+        logger.debug("Time to compute all energies %.3f s (%.3f per energy calculation).", elapsed_time, time_per_energy)
+
+
+    def _gather_energies(self):
+        """Send the u_kl columns computed for this node's share of states to all nodes."""
         energies_gather = self.mpicomm.allgather(self.u_kl[:,self.mpicomm.rank:self.n_states:self.mpicomm.size])
         for state_index in range(self.n_states):
             source = state_index % self.mpicomm.size # node with trajectory data
             index = state_index // self.mpicomm.size # index within trajectory batch
             self.u_kl[:,state_index] = energies_gather[source][:,index]
 
-        end_time = time.time()
-        elapsed_time = end_time - start_time
-        time_per_energy= elapsed_time / float(self.n_states)**2 
-        logger.debug("Time to compute all energies %.3f s (%.3f per energy calculation)." % (elapsed_time, time_per_energy))
-
 
     def _mix_all_replicas(self):
         """Attempt exchanges between all replicas to enhance mixing.
@@ -477,7 +555,7 @@ class ReplicaExchange(object):
         nswap_attempts = self.n_states**5 # number of swaps to attempt (ideal, but too slow!)
         nswap_attempts = self.n_states**3 # best compromise for pure Python?
         
-        logger.debug("Will attempt to swap all pairs of replicas, using a total of %d attempts." % nswap_attempts)
+        logger.debug("Will attempt to swap all pairs of replicas, using a total of %d attempts.", nswap_attempts)
 
         # Attempt swaps to mix replicas.
         for swap_attempt in range(nswap_attempts):
@@ -510,6 +588,25 @@ class ReplicaExchange(object):
                 self.Nij_accepted[istate,jstate] += 1
                 self.Nij_accepted[jstate,istate] += 1
 
+    def _mix_all_replicas_numba(self):
+        """Attempt exchanges between all replicas to enhance mixing.  Uses 'numba'.
+        
+        Notes
+        -----
+        
+        The swap loop is compiled by numba (see `repex.kernels`); the compiled
+        code is cached on disk, so the compilation cost is only paid once.
+        
+        """
+
+        # Determine number of swaps to attempt to ensure thorough mixing.
+        # TODO: Replace this with analytical result computed to guarantee sufficient mixing.
+        nswap_attempts = self.n_states**4 # number of swaps to attempt
+        
+        logger.debug("Will attempt to swap all pairs of replicas using numba-accelerated code, using a total of %d attempts.", nswap_attempts)
+
+        kernels.mix_all_replicas(self.u_kl, self.replica_states, self.Nij_proposed, self.Nij_accepted, nswap_attempts)
+
     def _mix_all_replicas_weave(self):
         """Attempt exchanges between all replicas to enhance mixing.  Uses 'weave'.
         
@@ -529,7 +626,7 @@ class ReplicaExchange(object):
         nswap_attempts = self.n_states**4 # number of swaps to attempt
         # Handled in C code below.
         
-        logger.debug("Will attempt to swap all pairs of replicas using weave-accelerated code, using a total of %d attempts." % nswap_attempts)
+        logger.debug("Will attempt to swap all pairs of replicas using weave-accelerated code, using a total of %d attempts.", nswap_attempts)
 
         from scipy import weave
 
@@ -650,11 +747,14 @@ class ReplicaExchange(object):
         if self.parameters.replica_mixing_scheme == 'swap-neighbors':
             self._mix_neighboring_replicas()        
         elif self.parameters.replica_mixing_scheme == 'swap-all':
-            # Try to use weave-accelerated mixing code if possible, otherwise fall back to Python-accelerated code.            
-            try:
-                self._mix_all_replicas_weave()            
-            except:
-                self._mix_all_replicas()
+            # Try to use numba- or weave-accelerated mixing code if possible, otherwise fall back to Python-accelerated code.
+            if kernels.HAVE_NUMBA or kernels.HAVE_AOT:
+                self._mix_all_replicas_numba()
+            else:
+                try:
+                    self._mix_all_replicas_weave()
+                except:
+                    self._mix_all_replicas()
         elif self.parameters.replica_mixing_scheme == 'none':
             # Don't mix replicas.
             pass
@@ -667,27 +767,30 @@ class ReplicaExchange(object):
         nswaps_accepted = self.Nij_accepted.sum()
         swap_fraction_accepted = 0.0
         if (nswaps_attempted > 0): swap_fraction_accepted = float(nswaps_accepted) / float(nswaps_attempted);            
-        logger.debug("Accepted %d / %d attempted swaps (%.1f %%)" % (nswaps_accepted, nswaps_attempted, swap_fraction_accepted * 100.0))
+        logger.debug("Accepted %d / %d attempted swaps (%.1f %%)", nswaps_accepted, nswaps_attempted, swap_fraction_accepted * 100.0)
 
         # Estimate cumulative transition probabilities between all states.
-        Nij_accepted = self.database.accepted[:].sum(0) + self.Nij_accepted
-        Nij_proposed = self.database.proposed[:].sum(0) + self.Nij_proposed
-        swap_Pij_accepted = np.zeros([self.n_states,self.n_states], np.float64)
-        for istate in range(self.n_states):
-            Ni = Nij_proposed[istate,:].sum()
-            if (Ni == 0):
-                swap_Pij_accepted[istate,istate] = 1.0
-            else:
-                swap_Pij_accepted[istate,istate] = 1.0 - float(Nij_accepted[istate,:].sum() - Nij_accepted[istate,istate]) / float(Ni)
-                for jstate in range(self.n_states):
-                    if istate != jstate:
-                        swap_Pij_accepted[istate,jstate] = float(Nij_accepted[istate,jstate]) / float(Ni)
+        # This reads the full swap history from the database, so only do it when it will be shown.
+        if logger.isEnabledFor(logging.DEBUG):
+            Nij_accepted = self.database.accepted[:].sum(0) + self.Nij_accepted
+            Nij_proposed = self.database.proposed[:].sum(0) + self.Nij_proposed
+            swap_Pij_accepted = np.zeros([self.n_states,self.n_states], np.float64)
+            for istate in range(self.n_states):
+                Ni = Nij_proposed[istate,:].sum()
+                if (Ni == 0):
+                    swap_Pij_accepted[istate,istate] = 1.0
+                else:
+                    swap_Pij_accepted[istate,istate] = 1.0 - float(Nij_accepted[istate,:].sum() - Nij_accepted[istate,istate]) / float(Ni)
+                    for jstate in range(self.n_states):
+                        if istate != jstate:
+                            swap_Pij_accepted[istate,jstate] = float(Nij_accepted[istate,jstate]) / float(Ni)
+            logger.debug("Cumulative swap acceptance probabilities:\n%s", swap_Pij_accepted)
     
         # Root node will share state information with all replicas.
         logger.debug("Sharing state information...")
         self.replica_states = self.mpicomm.bcast(self.replica_states, root=0)
 
-        logger.debug("Mixing of replicas took %.3f s" % (end_time - start_time))
+        logger.debug("Mixing of replicas took %.3f s", end_time - start_time)
 
 
     def _show_mixing_statistics(self):
@@ -719,29 +822,31 @@ class ReplicaExchange(object):
         if not self.mpicomm.rank == 0:
             return
 
-        positions = np.array([self.sampler_states[replica_index].positions / units.nanometers for replica_index in range(self.n_states)])
-        box_vectors = np.array([self.sampler_states[replica_index].box_vectors / units.nanometers for replica_index in range(self.n_states)])
-        
-        
-        volumes = []
-        for replica_index in range(self.n_states):
-            v = self.sampler_states[replica_index].box_vectors
-            state_index = self.replica_states[replica_index]
-            state = self.thermodynamic_states[state_index]
-            volumes.append(thermodynamics.volume(v) / (units.nanometers ** 3))
-        
-        volumes = np.array(volumes)
-
-        self.database.write("positions", positions, self.iteration, sync=False)
-        self.database.write("box_vectors", box_vectors, self.iteration, sync=False)
-        self.database.write("volumes", volumes, self.iteration, sync=False)
+        # Strip units in a single pass over the replicas, straight into the database's staging slots for this iteration.
+        # The slots are only committed once they are all filled, so a failure here stages nothing.
+        positions = self.database.stage("positions", self.iteration)
+        box_vectors = self.database.stage("box_vectors", self.iteration)
+        volumes = self.database.stage("volumes", self.iteration)
+        for replica_index, sampler_state in enumerate(self.sampler_states):
+            positions[replica_index] = sampler_state.positions.value_in_unit(units.nanometers)
+            box_vectors[replica_index] = sampler_state.box_vectors.value_in_unit(units.nanometers)
+        volumes[:] = np.linalg.det(box_vectors)  # Same as thermodynamics.volume(), for all replicas at once
+        for key in ["positions", "box_vectors", "volumes"]:
+            self.database.commit(key, self.iteration)
+
+        # The remaining variables are copied into their staging slots by write().
+        self.database.write("timestamp", time.time(), self.iteration, sync=False)
         self.database.write("states", self.replica_states, self.iteration, sync=False)
-        self.database.write("energies", self.u_kl, self.iteration, sync=False)
         self.database.write("proposed", self.Nij_proposed, self.iteration, sync=False)
         self.database.write("accepted", self.Nij_accepted, self.iteration, sync=False)
-        self.database.write("timestamp", time.time(), self.iteration, sync=False)
+        self.database.write("energies", self.u_kl, self.iteration, sync=False)  # Cast to the float32 'energies' variable when staged
         
-        self.database.sync()
+        # Staged iterations are written in one slab every `write_buffer_size` iterations,
+        # and the file is only synced to disk every `sync_interval` iterations.
+        if self.iteration % self.parameters.sync_interval == 0:
+            self.database.sync()
+        elif self.iteration % self.parameters.write_buffer_size == 0:
+            self.database.flush()
             
 
     def _run_sanity_checks(self):
@@ -753,7 +858,7 @@ class ReplicaExchange(object):
         # Check sampler state (positions and generalized coordinates).
         for replica_index in range(self.n_replicas):
             if self.sampler_states[replica_index].has_nan():
-                logger.warn("nan encountered in replica %d coordinates." % replica_index)
+                logger.warn("nan encountered in replica %d coordinates.", replica_index)
                 abort = True
 
         # Check energies.
@@ -768,11 +873,11 @@ class ReplicaExchange(object):
     def _show_energies(self):
         """Show energies (in units of kT) for all replicas at all states.
         """
-        if self.mpicomm.rank != 0 or not self.parameters.show_energies:
+        if self.mpicomm.rank != 0 or not self.parameters.show_energies or not logger.isEnabledFor(logging.INFO):
             return
 
         U = pd.DataFrame(self.u_kl)
-        logger.info("\n%-24s %16s\n%s" % ("reduced potential (kT)", "current state", U.to_string()))
+        logger.info("\n%-24s %16s\n%s", "reduced potential (kT)", "current state", U.to_string())
 
     @classmethod
     def create(cls, thermodynamic_states, coordinates, filename, mpicomm=None, platform=None, parameters={}):
@@ -784,7 +889,8 @@ class ReplicaExchange(object):
         thermodynamic_states : list([ThermodynamicStates])
             The list of thermodynamic states to simulate in
         coordinates : list([simtk.unit.Quantity]), shape=(n_replicas, n_atoms, 3), unit=Length
-            The starting coordinates for each replica
+            The starting coordinates for each replica, or a single set of
+            coordinates shared by all replicas
         filename : string 
             name of NetCDF file to bind to for simulation output and checkpointing
         mpicomm : mpi4py communicator, default=None
@@ -798,7 +904,7 @@ class ReplicaExchange(object):
         coordinates = validate_coordinates(coordinates, thermodynamic_states)
 
         if mpicomm is None or (mpicomm.rank == 0):
-            database = netcdf_io.NetCDFDatabase(filename, thermodynamic_states, coordinates)  # To do: eventually use factory for looking up database type via filename
+            database = netcdf_io.NetCDFDatabase(filename, thermodynamic_states, coordinates, compression=parameters.get("netcdf_compression", cls.default_parameters["netcdf_compression"]))  # To do: eventually use factory for looking up database type via filename
         else:
             database = None
 
@@ -858,8 +964,10 @@ def validate_coordinates(coordinates, thermodynamic_states):
     Parameters
     ----------
     
-    coordinates : list 
-        List of input coordinate sets
+    coordinates : list or simtk.unit.Quantity
+        List of input coordinate sets, a single coordinate set of shape
+        (n_atoms, 3) to be used for every state, or a Quantity of shape
+        (n_sets, n_atoms, 3) holding one coordinate set per entry
     thermodynamic_state : list (of ThermodynamicStates)
         List of thermodynamic states
     
@@ -868,8 +976,22 @@ def validate_coordinates(coordinates, thermodynamic_states):
     
     new_coordinates : list
         A list of coordinate sets of length n_states
+
+    Notes
+    -----
+
+    Missing coordinate sets are filled in by reference rather than by copy.
+    Every replica's positions are replaced (never modified in place) after
+    propagation, and OpenMM copies positions into the Context anyway, so
+    sharing the input sets avoids n_states redundant copies at setup.
     
     """
+
+    if isinstance(coordinates, units.Quantity):
+        if np.ndim(coordinates[0] / coordinates.unit) == 1:  # A single (n_atoms, 3) set; checking one row avoids converting the whole set
+            coordinates = [coordinates]
+        else:  # One (n_atoms, 3) set per replica
+            coordinates = [coordinates[i] for i in range(len(coordinates))]
     
     n_coord = len(coordinates)
     n_states = len(thermodynamic_states)
@@ -881,10 +1003,8 @@ def validate_coordinates(coordinates, thermodynamic_states):
         raise(Exception("Cannot input more coordinates than states."))
 
     elif n_coord < n_states:
-        logger.info("Input %d coordinates but %d states, so copying additional coordinates." % (n_coord, n_states))
-        new_coordinates = []
-        for i in range(n_states):
-            new_coordinates.append(copy.deepcopy(coordinates[i % n_coord]))
+        logger.info("Input %d coordinates but %d states, so reusing coordinates.", n_coord, n_states)
+        new_coordinates = [coordinates[i % n_coord] for i in range(n_states)]
     
     elif n_coord == n_states:
         new_coordinates = coordinates
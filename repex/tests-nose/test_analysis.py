@@ -143,3 +143,25 @@ def test_output_diagnostics():
     db.check_energies()
     
     db.output_diagnostics(tempdir + "/diagnostics/")
+
+
+def test_read_by_replica_no_iterations():
+    nc_filename = tempfile.mkdtemp() + "/out.nc"
+
+    T_min = 1.0 * unit.kelvin
+    T_i = [T_min, T_min * 10., T_min * 100.]
+    n_replicas = len(T_i)
+
+    ho = testsystems.HarmonicOscillator()
+
+    states = [ ThermodynamicState(system=ho.system, temperature=T_i[i]) for i in range(n_replicas) ]
+    coordinates = [ho.positions] * n_replicas
+
+    mpicomm = dummympi.DummyMPIComm()
+    replica_exchange = ReplicaExchange.create(states, coordinates, nc_filename, mpicomm=mpicomm)
+
+    db = replica_exchange.database
+    trace = np.zeros((0, n_replicas, 1, 3), np.float32)
+    xyz = db._read_by_replica(trace, np.zeros(0, np.int64))
+    eq(xyz.shape, (0, 1, 3))
+    eq(xyz.dtype, trace.dtype)
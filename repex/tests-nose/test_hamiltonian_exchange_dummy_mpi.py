@@ -1,5 +1,6 @@
 import os
 import numpy as np
+import simtk.openmm as mm
 import simtk.unit as unit
 from repex.thermodynamics import ThermodynamicState
 from repex import hamiltonian_exchange
@@ -8,7 +9,7 @@ from repex.utils import permute_energies
 from repex import dummympi
 from repex import resume
 import tempfile
-from mdtraj.testing import eq, skipif
+from mdtraj.testing import eq, skipif, raises
 from repex.constants import kB
 from unittest import skipIf
 
@@ -74,3 +75,76 @@ def test_hrex_save_and_load():
     replica_exchange = resume(nc_filename)
     eq(replica_exchange.iteration, 200)
     replica_exchange.run()
+
+
+@raises(ValueError)
+def test_hrex_inconsistent_temperatures():
+
+    oscillators = [testsystems.PowerOscillator(b=power) for power in [2., 4.]]
+    states = [ThermodynamicState(system=ho.system, temperature=temperature) for (ho, temperature) in zip(oscillators, [1 * unit.kelvin, 2 * unit.kelvin])]
+
+    hamiltonian_exchange.HamiltonianExchange(states, mpicomm=dummympi.DummyMPIComm())
+
+
+def test_hrex_propagates_with_state_systems():
+
+    nc_filename = tempfile.mkdtemp() + "/out.nc"
+
+    oscillators = [testsystems.PowerOscillator(b=power) for power in [2., 4.]]
+    systems = [ho.system for ho in oscillators]
+    positions = [ho.positions for ho in oscillators]
+    state = ThermodynamicState(system=systems[0], temperature=1 * unit.kelvin)
+
+    mpicomm = dummympi.DummyMPIComm()
+    parameters = {"number_of_iterations":2}
+    replica_exchange = hamiltonian_exchange.HamiltonianExchange.create(state, systems, positions, nc_filename, mpicomm=mpicomm, parameters=parameters)
+    serialized = [mm.XmlSerializer.serialize(s.system) for s in replica_exchange.thermodynamic_states]
+    replica_exchange.run()
+
+    # Each state's Context runs that state's Hamiltonian, and propagation leaves the state's System unchanged.
+    for state_index, (context, integrator) in replica_exchange._contexts.items():
+        eq(mm.XmlSerializer.serialize(context.getSystem()), serialized[state_index])
+    eq([mm.XmlSerializer.serialize(s.system) for s in replica_exchange.thermodynamic_states], serialized)
+
+
+def _lambda_oscillator():
+    """Return a harmonic oscillator whose restraint is scaled by a `lambda` global parameter."""
+    ho = testsystems.HarmonicOscillator()
+    force = mm.CustomExternalForce("lambda * (x^2 + y^2 + z^2)")
+    force.addGlobalParameter("lambda", 1.0)
+    force.addParticle(0, [])
+    ho.system.addForce(force)
+    return ho
+
+
+def test_hrex_create_from_lambda():
+
+    nc_filename = tempfile.mkdtemp() + "/out.nc"
+
+    ho = _lambda_oscillator()
+    state = ThermodynamicState(system=ho.system, temperature=1 * unit.kelvin)
+    lambda_values = [0.25, 0.5, 1.0]
+
+    mpicomm = dummympi.DummyMPIComm()
+    parameters = {"number_of_iterations":3}
+    replica_exchange = hamiltonian_exchange.HamiltonianExchange.create_from_lambda(state, lambda_values, ho.positions, nc_filename, mpicomm=mpicomm, parameters=parameters)
+
+    eq(replica_exchange.n_states, len(lambda_values))
+    for thermodynamic_state, lambda_value in zip(replica_exchange.thermodynamic_states, lambda_values):
+        forces = [force for force in thermodynamic_state.system.getForces() if isinstance(force, mm.CustomExternalForce)]
+        eq(forces[0].getGlobalParameterDefaultValue(0), lambda_value)
+
+    replica_exchange.run()
+    eq(replica_exchange.iteration, 3)
+
+
+@raises(ValueError)
+def test_hrex_create_from_lambda_missing_parameter():
+
+    nc_filename = tempfile.mkdtemp() + "/out.nc"
+
+    ho = _lambda_oscillator()
+    state = ThermodynamicState(system=ho.system, temperature=1 * unit.kelvin)
+
+    mpicomm = dummympi.DummyMPIComm()
+    hamiltonian_exchange.HamiltonianExchange.create_from_lambda(state, [0.5, 1.0], ho.positions, nc_filename, parameter_name="no_such_parameter", mpicomm=mpicomm)
@@ -0,0 +1,19 @@
+import numpy as np
+from repex import kernels
+from mdtraj.testing import eq
+
+
+def test_mix_all_replicas_is_permutation():
+    n_states = 5
+    u_kl = np.random.normal(size=(n_states, n_states))
+    replica_states = np.arange(n_states)
+    Nij_proposed = np.zeros([n_states, n_states], np.int64)
+    Nij_accepted = np.zeros([n_states, n_states], np.int64)
+
+    kernels.mix_all_replicas(u_kl, replica_states, Nij_proposed, Nij_accepted, n_states**4)
+
+    eq(np.sort(replica_states), np.arange(n_states))
+    eq(Nij_proposed, Nij_proposed.T)
+    eq(Nij_accepted, Nij_accepted.T)
+    assert np.all(Nij_accepted <= Nij_proposed)
+    eq(int(Nij_proposed.sum()), 2 * n_states**4)
@@ -37,3 +37,104 @@ def test_double_set_thermodynamic_states():
 
     states = replica_exchange.thermodynamic_states
     replica_exchange.database.thermodynamic_states = states
+
+
+def test_compression():
+    ho = testsystems.HarmonicOscillator()
+    n_temps = 3
+
+    for compression in [0, 1]:
+        nc_filename = tempfile.mkdtemp() + "/out.nc"
+        mpicomm = dummympi.DummyMPIComm()
+        parameters = {"number_of_iterations":2, "netcdf_compression":compression}
+        replica_exchange = ParallelTempering.create(ho.system, ho.positions, nc_filename, T_min=1.0 * unit.kelvin, T_max=10.0 * unit.kelvin, n_temps=n_temps, mpicomm=mpicomm, parameters=parameters)
+        replica_exchange.run()
+
+        for key in ["positions", "energies", "accepted"]:
+            filters = replica_exchange.database.ncfile.variables[key].filters()
+            eq(filters["zlib"], compression > 0)
+        eq(replica_exchange.database.positions.shape[0], 3)
+
+
+def test_parameters_round_trip():
+    nc_filename = tempfile.mkdtemp() + "/out.nc"
+    ho = testsystems.HarmonicOscillator()
+
+    mpicomm = dummympi.DummyMPIComm()
+    parameters = {"number_of_iterations":2, "timestep":1.5 * unit.femtoseconds, "show_energies":False, "title":"round trip"}
+    replica_exchange = ParallelTempering.create(ho.system, ho.positions, nc_filename, T_min=1.0 * unit.kelvin, T_max=10.0 * unit.kelvin, n_temps=3, mpicomm=mpicomm, parameters=parameters)
+    replica_exchange.run()
+    replica_exchange.extend(2)
+
+    loaded = replica_exchange.database._load_parameters()
+    eq(loaded["number_of_iterations"], 4)
+    eq(loaded["timestep"] / unit.femtoseconds, 1.5)
+    eq(loaded["show_energies"], False)
+    eq(loaded["title"], "round trip")
+    eq(loaded["integrator"], None)
+
+
+def test_shared_systems_parsed_once():
+    nc_filename = tempfile.mkdtemp() + "/out.nc"
+    ho = testsystems.HarmonicOscillator()
+
+    mpicomm = dummympi.DummyMPIComm()
+    parameters = {"number_of_iterations":2}
+    replica_exchange = ParallelTempering.create(ho.system, ho.positions, nc_filename, T_min=1.0 * unit.kelvin, T_max=10.0 * unit.kelvin, n_temps=3, mpicomm=mpicomm, parameters=parameters)
+    replica_exchange.run()
+    del replica_exchange
+
+    replica_exchange = resume(nc_filename, mpicomm=mpicomm)
+    states = replica_exchange.thermodynamic_states
+    assert all(state.system is states[0].system for state in states)
+    eq(len(replica_exchange.database._systems), 1)
+
+
+@raises(ValueError)
+def test_write_wrong_shape():
+    nc_filename = tempfile.mkdtemp() + "/out.nc"
+    ho = testsystems.HarmonicOscillator()
+
+    mpicomm = dummympi.DummyMPIComm()
+    parameters = {"number_of_iterations":1}
+    replica_exchange = ParallelTempering.create(ho.system, ho.positions, nc_filename, T_min=1.0 * unit.kelvin, T_max=10.0 * unit.kelvin, n_temps=3, mpicomm=mpicomm, parameters=parameters)
+    replica_exchange.database.write("energies", np.zeros((2, 2)), 0, sync=False)
+
+
+def test_write_buffer_overflow():
+    nc_filename = tempfile.mkdtemp() + "/out.nc"
+    ho = testsystems.HarmonicOscillator()
+
+    mpicomm = dummympi.DummyMPIComm()
+    parameters = {"number_of_iterations":1, "write_buffer_size":2}
+    replica_exchange = ParallelTempering.create(ho.system, ho.positions, nc_filename, T_min=1.0 * unit.kelvin, T_max=10.0 * unit.kelvin, n_temps=3, mpicomm=mpicomm, parameters=parameters)
+    database = replica_exchange.database
+
+    energies = np.zeros((3, 3))
+    for iteration in range(1, 6):
+        energies[:] = iteration  # The staged copy must not change when the caller reuses its array.
+        database.write("energies", energies, iteration, sync=False)
+    database.sync()
+
+    eq(database.ncfile.variables["energies"].shape[0], 6)
+    for iteration in range(1, 6):
+        eq(np.array(database.ncfile.variables["energies"][iteration]), np.ones((3, 3)) * iteration)
+
+
+def test_failed_output_iteration_writes_nothing():
+    nc_filename = tempfile.mkdtemp() + "/out.nc"
+    ho = testsystems.HarmonicOscillator()
+
+    mpicomm = dummympi.DummyMPIComm()
+    parameters = {"number_of_iterations":1, "write_buffer_size":2}
+    replica_exchange = ParallelTempering.create(ho.system, ho.positions, nc_filename, T_min=1.0 * unit.kelvin, T_max=10.0 * unit.kelvin, n_temps=3, mpicomm=mpicomm, parameters=parameters)
+    database = replica_exchange.database
+    eq(database.ncfile.variables["positions"].shape[0], 1)  # Iteration zero
+
+    # Positions with the wrong shape make the fill of the staging slots fail partway through.
+    replica_exchange.iteration = 1
+    replica_exchange.sampler_states[1].positions = unit.Quantity(np.zeros((2, 3)), unit.nanometers)
+    assert_raises(ValueError, replica_exchange.output_iteration)
+
+    database.sync()
+    eq(database.ncfile.variables["positions"].shape[0], 1)
@@ -1,7 +1,8 @@
 import numpy as np
+import simtk.openmm as mm
 import simtk.unit as unit
 from repex.thermodynamics import ThermodynamicState
-from repex.parallel_tempering import ParallelTempering
+from repex.parallel_tempering import ParallelTempering, IgnoreBarostat
 from openmmtools import testsystems
 from repex.utils import permute_energies
 from repex import dummympi
@@ -119,3 +120,123 @@ def test_parallel_tempering_explicit_temperature_input():
     replica_exchange.run()
     
     eq(replica_exchange.n_replicas, n_temps)
+
+
+def test_parallel_tempering_write_buffer():
+
+    nc_filename = tempfile.mkdtemp() + "/out.nc"
+
+    T_min = 1.0 * unit.kelvin
+    T_max = 10.0 * unit.kelvin
+    n_temps = 3
+
+    ho = testsystems.HarmonicOscillator()
+
+    system = ho.system
+    positions = ho.positions
+
+    coordinates = [positions] * n_temps
+
+    mpicomm = dummympi.DummyMPIComm()
+    parameters = {"number_of_iterations":10, "write_buffer_size":4}
+    replica_exchange = ParallelTempering.create(system, coordinates, nc_filename, T_min=T_min, T_max=T_max, n_temps=n_temps, mpicomm=mpicomm, parameters=parameters)
+    replica_exchange.run()
+
+    eq(replica_exchange.database.ncfile.variables["energies"].shape[0], 11)
+    eq(replica_exchange.database.last_iteration, 10)
+
+def test_parallel_tempering_single_positions():
+    nc_filename = tempfile.mkdtemp() + "/out.nc"
+
+    T_min = 1.0 * unit.kelvin
+    T_max = 10.0 * unit.kelvin
+    n_temps = 3
+
+    ho = testsystems.HarmonicOscillator()
+
+    mpicomm = dummympi.DummyMPIComm()
+    parameters = {"number_of_iterations":2}
+    replica_exchange = ParallelTempering.create(ho.system, ho.positions, nc_filename, T_min=T_min, T_max=T_max, n_temps=n_temps, mpicomm=mpicomm, parameters=parameters)
+
+    eq(replica_exchange.n_replicas, n_temps)
+
+    replica_exchange.run()
+
+
+def test_ignore_barostat_shared_system():
+    system = testsystems.HarmonicOscillator().system
+    barostat = mm.MonteCarloBarostat(1.0 * unit.atmospheres, 300.0 * unit.kelvin)
+    barostat.setRandomNumberSeed(5)
+    system.addForce(barostat)
+
+    # States that share one System (and therefore one barostat), as restored from identical serialized systems.
+    states = [ThermodynamicState._fast_clone_with_system(system, 300.0 * unit.kelvin, 1.0 * unit.atmospheres) for i in range(3)]
+    assert all(state.system is system for state in states)
+
+    with IgnoreBarostat(states):
+        eq(barostat.getTemperature() / unit.kelvin, 1.0)
+
+    eq(barostat.getTemperature() / unit.kelvin, 300.0)
+    eq(barostat.getRandomNumberSeed(), 5)
+
+
+def test_ignore_barostat_separate_systems():
+    system = testsystems.HarmonicOscillator().system
+    states = [ThermodynamicState(system=system, temperature=T * unit.kelvin, pressure=1.0 * unit.atmospheres) for T in [300.0, 310.0, 320.0]]
+    barostats = [[f for f in state.system.getForces() if isinstance(f, mm.MonteCarloBarostat)][0] for state in states]
+    seeds = [b.getRandomNumberSeed() for b in barostats]
+
+    with IgnoreBarostat(states):
+        for b in barostats:
+            eq(b.getTemperature() / unit.kelvin, 1.0)
+
+    for (b, T, seed) in zip(barostats, [300.0, 310.0, 320.0], seeds):
+        eq(b.getTemperature() / unit.kelvin, T)
+        eq(b.getRandomNumberSeed(), seed)
+
+
+def test_parallel_tempering_states_share_system():
+    nc_filename = tempfile.mkdtemp() + "/out.nc"
+    ho = testsystems.HarmonicOscillator()
+
+    mpicomm = dummympi.DummyMPIComm()
+    parameters = {"number_of_iterations":1}
+    replica_exchange = ParallelTempering.create(ho.system, ho.positions, nc_filename, T_min=1.0 * unit.kelvin, T_max=10.0 * unit.kelvin, n_temps=3, mpicomm=mpicomm, parameters=parameters)
+
+    states = replica_exchange.thermodynamic_states
+    assert all(state.system is states[0].system for state in states)
+    assert states[0].system is not ho.system
+
+
+class _TwoNodeComm(dummympi.DummyMPIComm):
+    """Reports rank 0 of a two-node run, to check per-node bookkeeping without MPI."""
+    def __init__(self):
+        super(_TwoNodeComm, self).__init__()
+        self.size = 2
+
+
+def test_parallel_tempering_replica_contexts_bounded():
+    nc_filename = tempfile.mkdtemp() + "/out.nc"
+    ho = testsystems.HarmonicOscillator()
+    n_temps = 4
+
+    parameters = {"number_of_iterations":1, "nsteps_per_iteration":1, "number_of_equilibration_iterations":0}
+    replica_exchange = ParallelTempering.create(ho.system, ho.positions, nc_filename, T_min=1.0 * unit.kelvin, T_max=10.0 * unit.kelvin, n_temps=n_temps, mpicomm=dummympi.DummyMPIComm(), parameters=parameters)
+    replica_exchange.mpicomm = _TwoNodeComm()
+
+    # Count the Contexts this node creates.
+    created = []
+    create_context = replica_exchange._create_context
+    def counting_create_context(thermodynamic_state):
+        created.append(thermodynamic_state)
+        return create_context(thermodynamic_state)
+    replica_exchange._create_context = counting_create_context
+
+    # Node 0 of 2 propagates the replicas at states 0 and 2; move every replica through those states.
+    for shift in range(n_temps):
+        replica_exchange.replica_states = np.roll(np.arange(n_temps), shift)
+        for replica_index in range(n_temps):
+            if replica_exchange.replica_states[replica_index] % 2 == 0:
+                replica_exchange._propagate_replica(replica_index)
+
+    eq(len(created), 2)  # One Context per state of this node, although all four replicas passed through
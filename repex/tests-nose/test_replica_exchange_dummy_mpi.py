@@ -1,7 +1,7 @@
 import numpy as np
 import simtk.unit as unit
 from repex.thermodynamics import ThermodynamicState
-from repex.replica_exchange import ReplicaExchange
+from repex.replica_exchange import ReplicaExchange, validate_coordinates
 from openmmtools import testsystems
 from repex.utils import permute_energies
 from repex import dummympi
@@ -91,3 +91,21 @@ def test_harmonic_oscillators_fewer_coordinates_than_states():
     parameters = {"number_of_iterations":10}
     replica_exchange = ReplicaExchange.create(states, coordinates, nc_filename, mpicomm=mpicomm, parameters=parameters)
     replica_exchange.run()
+
+
+def test_validate_coordinates_quantity():
+    n_states = 3
+    states = [ThermodynamicState(system=testsystems.HarmonicOscillator().system, temperature=1.0 * unit.kelvin) for i in range(n_states)]
+
+    # A single (n_atoms, 3) set is shared by every state.
+    single = unit.Quantity(np.zeros((1, 3)), unit.nanometers)
+    coordinates = validate_coordinates(single, states)
+    eq(len(coordinates), n_states)
+    assert all(x is single for x in coordinates)
+
+    # A (n_states, n_atoms, 3) Quantity holds one set per state.
+    stacked = unit.Quantity(np.arange(n_states * 3.0).reshape((n_states, 1, 3)), unit.nanometers)
+    coordinates = validate_coordinates(stacked, states)
+    eq(len(coordinates), n_states)
+    for i in range(n_states):
+        eq(coordinates[i] / unit.nanometers, stacked[i] / unit.nanometers)
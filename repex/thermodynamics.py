@@ -103,47 +103,83 @@ class ThermodynamicState(object):
 
         """
 
-        # Initialize.
-        self.system = None          # the System object governing the potential energy computation
-        self.temperature = None     # the temperature
-        self.pressure = None        # the pressure, or None if not isobaric
-
-        self._cache_context = True  # if True, try to cache Context object
-        self._context = None        # cached Context
-        self._integrator = None     # cached Integrator
-
         # Store provided values.
         if system is not None:
             if type(system) is not mm.System:
                 raise(TypeError("system must be an OpenMM System; instead found %s" % type(system)))
-            self.system = copy.deepcopy(system) # TODO: Do this when deep copy works.
+            system = copy.deepcopy(system) # TODO: Do this when deep copy works.
             # self.system = system # we make a shallow copy for now, which can cause trouble later
-        if temperature is not None:
-            self.temperature = temperature
-        if pressure is not None:
-            self.pressure = pressure
 
-        # If temperature and pressure are specified, make sure MonteCarloBarostat is attached.
-        if temperature and pressure:
-            # Try to find barostat.
-            barostat = False
-            for force_index in range(self.system.getNumForces()):
-                force = self.system.getForce(force_index)
-                # Dispatch forces
-                if isinstance(force, mm.MonteCarloBarostat):
-                    barostat = force
-                    break
-            if barostat:
-                # Set temperature.
-                # TODO: Set pressure too, once that option is available.
-                barostat.setTemperature(temperature)                
-            else:
-                # Create barostat.
-                barostat = mm.MonteCarloBarostat(pressure, temperature)
-                self.system.addForce(barostat)                    
+        self._initialize(system, temperature, pressure)
 
         return
 
+    @classmethod
+    def _fast_clone_with_system(cls, system, temperature, pressure=None):
+        """Construct a state that takes ownership of `system`, with already-validated temperature and pressure.
+
+        Parameters
+        ----------
+
+        system : simtk.openmm.System
+            System object describing the potential energy function.
+            It is used as is, NOT copied.
+        temperature : simtk.unit.Quantity, compatible with 'kelvin'
+            Temperature for a system with constant temperature
+        pressure : simtk.unit.Quantity,  compatible with 'atmospheres', optional, default=None
+            If not None, specifies the pressure for constant-pressure systems.
+
+        Notes
+        -----
+
+        This skips the type check and the deep copy done in __init__, so that
+        several states can share one System, e.g. the states of a parallel
+        tempering run or states restored from identical serialized systems.
+        Callers must own `system`: if a pressure is given, a barostat at
+        `temperature` is attached to (or updated in) `system` itself.
+
+        """
+
+        # Create new object, bypassing init.
+        self = cls.__new__(cls)
+        self._initialize(system, temperature, pressure)
+        return self
+
+    def _initialize(self, system, temperature, pressure):
+        """Set up the state attributes; shared by __init__ and _fast_clone_with_system()."""
+
+        self.system = system        # the System object governing the potential energy computation
+        self.temperature = temperature  # the temperature
+        self.pressure = pressure    # the pressure, or None if not isobaric
+
+        self._cache_context = True  # if True, try to cache Context object
+        self._context = None        # cached Context
+        self._integrator = None     # cached Integrator
+
+        # If temperature and pressure are specified, make sure MonteCarloBarostat is attached.
+        if temperature and pressure:
+            self._ensure_barostat()
+
+    def _ensure_barostat(self):
+        """Make sure a MonteCarloBarostat at the state temperature is attached to the system."""
+
+        # Try to find barostat.
+        barostat = False
+        for force_index in range(self.system.getNumForces()):
+            force = self.system.getForce(force_index)
+            # Dispatch forces
+            if isinstance(force, mm.MonteCarloBarostat):
+                barostat = force
+                break
+        if barostat:
+            # Set temperature.
+            # TODO: Set pressure too, once that option is available.
+            barostat.setTemperature(self.temperature)
+        else:
+            # Create barostat.
+            barostat = mm.MonteCarloBarostat(self.pressure, self.temperature)
+            self.system.addForce(barostat)
+
     def _create_context(self, platform=None):
         """Create Integrator and Context objects if they do not already exist.
         """
@@ -270,6 +306,22 @@ class ThermodynamicState(object):
         if (self.pressure is not None) and (box_vectors is None):
             raise ValueError("box_vectors must be specified if constant-pressure ensemble.")
 
+        # Compute energy.
+        potential_energy = self._potential_energy(coordinates, box_vectors, platform)
+        
+        # Compute inverse temperature.
+        beta = 1.0 / (kB * self.temperature)
+
+        # Compute reduced potential.
+        reduced_potential = beta * potential_energy
+        if self.pressure is not None:
+            reduced_potential += beta * self.pressure * volume(box_vectors) * units.AVOGADRO_CONSTANT_NA
+
+        return reduced_potential
+
+    def _potential_energy(self, coordinates, box_vectors=None, platform=None):
+        """Compute the potential energy (with units) of the given coordinates using the cached Context."""
+
         # Make sure we have Context and Integrator objects.
         self._create_context(platform)
 
@@ -285,20 +337,12 @@ class ThermodynamicState(object):
 
             # Compute energy
             potential_energy = self._compute_potential(coordinates, box_vectors)            
-        
-        # Compute inverse temperature.
-        beta = 1.0 / (kB * self.temperature)
-
-        # Compute reduced potential.
-        reduced_potential = beta * potential_energy
-        if self.pressure is not None:
-            reduced_potential += beta * self.pressure * volume(box_vectors) * units.AVOGADRO_CONSTANT_NA
 
         # Clean up context if requested, or if we're using Cuda (which can only have one active Context at a time).
         if (not self._cache_context) or (self._context.getPlatform().getName() == 'Cuda'):
             self._cleanup_context()
 
-        return reduced_potential
+        return potential_energy
 
     def reduced_potential_multiple(self, coordinates_list, box_vectors_list=None, platform=None):
         """Compute the reduced potential for the given sets of coordinates in this thermodynamic state.
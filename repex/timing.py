@@ -23,7 +23,7 @@ def benchmark(function, name=None):
         delta = end - start
             
         TIMINGS[name] = delta
-        logger.debug("Benchmarking %s: Start: %f.  End: %f.  Delta: %f" % (name, start, end, delta))
+        logger.debug("Benchmarking %s: Start: %f.  End: %f.  Delta: %f", name, start, end, delta)
         return result
     return timed
 
@@ -49,7 +49,7 @@ class TimeContext(object):
     def __exit__(self, ty, val, tb):
         self.end = time.time()
         self.time = self.end - self.start
-        logger.debug("%s: %0.3f seconds" % (self.name, self.time))
+        logger.debug("%s: %0.3f seconds", self.name, self.time)
         TIMINGS[self.name] = self.time
         return False
 
@@ -106,7 +106,7 @@ class Timer(object):
         logger.debug("Saved timings:")
 
         for keyword, time in self._elapsed.items():
-            logger.debug("%24s %8.3f s" % (keyword, time))
+            logger.debug("%24s %8.3f s", keyword, time)
         
         if clear == True:
             self.reset_timing_statistics()